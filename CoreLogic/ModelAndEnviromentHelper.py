@@ -3,49 +3,27 @@ from stable_baselines3 import A2C, PPO, TD3
 from stable_baselines3.common.evaluation import evaluate_policy
 import numpy as np
 from stable_baselines3.common.noise import NormalActionNoise
+from CoreLogic.scenario_generation import generate_meal_days, meal_events, DAILY_MEAL_PROFILE
 
-def generaltnap(bw):
-    from scipy import stats
-    from random import randint
-    meal = {
-        "probability": [0.95, 0.3, 0.95, 0.3, 0.95, 0.3],
-        "upperbound": [i * 60 for i in [9, 10, 14, 16, 20, 23]],
-        "lowerbound": [i * 60 for i in [5, 9, 10, 14, 16, 20]],
-        "upperboundmealtime": [i for i in [30, 10, 30, 10, 30, 10]],
-        "loverboundmealtime": [i for i in [10, 5, 10, 5, 10, 5]],
-        "meanmealtime": [i for i in [20, 7.5, 20, 7, 0.5, 20, 7.5]],  # Note: 0.5 may be a typo
-        "meantime": [i * 60 for i in [7, 9.5, 12, 15, 18, 21.5]],
-        "variancemealtime": [i for i in [5, 2, 5, 2, 5, 2]],
-        "variancetime": [60, 30, 60, 30, 60, 30],
-        "meanamount": [i * bw for i in [0.7, 0.15, 1.1, 0.15, 1.25, 0.15]],
-        "varianceamount": [i * bw * 0.15 for i in [0.7, 0.15, 1.1, 0.15, 1.25, 0.15]],
-        "E": []
-    }
-    for i in range(0, 6):
-        value = randint(0, 100)
-        if value / 100 < meal["probability"][i]:
-            s = stats.norm(loc=meal["meanamount"][i], scale=meal["varianceamount"][i])
-            s = s.rvs(10000)[randint(0, 9999)]
-            e = round(max(0, s))
-            s = stats.truncnorm(
-                (meal["lowerbound"][i] - meal["meantime"][i]) / meal["variancetime"][i],
-                (meal["upperbound"][i] - meal["meantime"][i]) / meal["variancetime"][i],
-                loc=meal["meantime"][i], scale=meal["variancetime"][i]
-            )
-            s = s.rvs(10000)[randint(0, 9999)]
-            t = round(s)
-            s = stats.truncnorm(
-                (meal["loverboundmealtime"][i] - meal["meanmealtime"][i]) / meal["variancemealtime"][i],
-                (meal["upperboundmealtime"][i] - meal["meanmealtime"][i]) / meal["variancemealtime"][i],
-                loc=meal["meanmealtime"][i], scale=meal["variancemealtime"][i]
-            )
-            s = s.rvs(10000)[randint(0, 9999)]
-            h = round(s)
-            meal["E"].append([int(e), int(t), int(h)])
-    return meal["E"]
+def generaltnap(bw, rng=None):
+    days = generate_meal_days(bw, 1, profile=DAILY_MEAL_PROFILE, rng=rng)
+    return meal_events(days, 0)
+
+def use_bank_day(envs, scenario_bank, day_index):
+    """
+    Points every env at meal day day_index of a ScenarioBank, so each trial trains and is evaluated
+    on the same meals as every other trial and tuner.
+    """
+    from CoreLogic.simulation_core import SimulationConfig, MealGenerator
+
+    for env in envs:
+        config = SimulationConfig(patient_name=env.unwrapped.env.patient_name)
+        config.scenario_bank = scenario_bank
+        scenario, _ = MealGenerator(config).create_meal_scenario(config.get_patient_params()["bw"], day_index=day_index)
+        env.unwrapped.set_scenario(scenario)
 
 class TD3HyperparameterTuner:
-    def __init__(self, low_env, inner_env, high_env, n_trials=50, n_eval_episodes=5):
+    def __init__(self, low_env, inner_env, high_env, n_trials=50, n_eval_episodes=5, scenario_bank=None, day_index=0):
         """
         Initialize the hyperparameter tuner for TD3 models.
 
@@ -55,12 +33,16 @@ class TD3HyperparameterTuner:
             high_env: Gymnasium environment for high glucose model.
             n_trials: Number of Optuna trials per model (default: 50).
             n_eval_episodes: Number of episodes for evaluation (default: 5).
+            scenario_bank: Path of a ScenarioBank; the envs then train and evaluate on its day day_index.
+            day_index: Bank day shared by every trial (default: 0).
         """
         self.low_env = low_env
         self.inner_env = inner_env
         self.high_env = high_env
         self.n_trials = n_trials
         self.n_eval_episodes = n_eval_episodes
+        if scenario_bank is not None:
+            use_bank_day((low_env, inner_env, high_env), scenario_bank, day_index)
         self.best_params = {
             "lowmodel": None,
             "innermodel": None,
@@ -239,7 +221,8 @@ class TD3HyperparameterTuner:
                     f.write("-" * 50 + "\n")
         print(f"Results saved to {filename}")
 class HyperparameterTuner:
-    def __init__(self, low_env, inner_env, high_env, n_trials=50, timesteps=500, n_eval_episodes=5):
+    def __init__(self, low_env, inner_env, high_env, n_trials=50, timesteps=500, n_eval_episodes=5,
+                 scenario_bank=None, day_index=0):
         """
         Initialize the hyperparameter tuner for A2C models.
 
@@ -250,6 +233,8 @@ class HyperparameterTuner:
             n_trials: Number of Optuna trials per model (default: 50).
             timesteps: Total timesteps for training each trial (default: 500).
             n_eval_episodes: Number of episodes for evaluation (default: 5).
+            scenario_bank: Path of a ScenarioBank; the envs then train and evaluate on its day day_index.
+            day_index: Bank day shared by every trial (default: 0).
         """
         self.low_env = low_env
         self.inner_env = inner_env
@@ -257,6 +242,8 @@ class HyperparameterTuner:
         self.n_trials = n_trials
         self.timesteps = timesteps
         self.n_eval_episodes = n_eval_episodes
+        if scenario_bank is not None:
+            use_bank_day((low_env, inner_env, high_env), scenario_bank, day_index)
         self.best_params = {
             "lowmodel": None,
             "innermodel": None,
@@ -408,12 +395,14 @@ class HyperparameterTuner:
         print(f"Results saved to {filename}")
 
 class PPOHyperparameterTuner:
-    def __init__(self, low_env, inner_env, high_env, n_trials=50, n_eval_episodes=5):
+    def __init__(self, low_env, inner_env, high_env, n_trials=50, n_eval_episodes=5, scenario_bank=None, day_index=0):
         self.low_env = low_env
         self.inner_env = inner_env
         self.high_env = high_env
         self.n_trials = n_trials
         self.n_eval_episodes = n_eval_episodes
+        if scenario_bank is not None:
+            use_bank_day((low_env, inner_env, high_env), scenario_bank, day_index)
         self.best_params = {
             "lowmodel": None,
             "innermodel": None,
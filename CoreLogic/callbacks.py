@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from stable_baselines3.common.callbacks import BaseCallback
+
+
+class RewardLoggerCallback(BaseCallback):
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self.rewards = []
+
+    def _on_step(self) -> bool:
+        self.rewards.append(self.locals['rewards'][0])
+        return True
+
+    def save_to_csv(self, filename):
+        pd.DataFrame({'timestep': range(1, len(self.rewards)+1), 'reward': self.rewards}).to_csv(filename, index=False)
+
+    def load_from_csv(self, filename):
+        self.rewards = pd.read_csv(filename)['reward'].tolist()
+
+
+def checkpoint_paths(checkpoint_dir: Path, model_name: str):
+    """
+    Files of a model's checkpoint. The .json is written last and marks the checkpoint as complete.
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    return {
+        "model": checkpoint_dir / f"{model_name}.zip",
+        "replay_buffer": checkpoint_dir / f"{model_name}_replay_buffer.pkl",
+        "rewards": checkpoint_dir / f"{model_name}_rewards.csv",
+        "meta": checkpoint_dir / f"{model_name}.json",
+    }
+
+
+class TrainingCheckpointCallback(BaseCallback):
+    """
+    Every save_freq environment steps saves the model (policy and optimizer state), the replay buffer
+    of off-policy models and the reward log into checkpoint_dir, replacing the previous checkpoint.
+    Files are written under a temporary name and renamed, so a preempted save leaves the last one intact.
+    """
+    def __init__(self, save_freq, checkpoint_dir: Path, model_name, reward_logger: RewardLoggerCallback = None,
+                 verbose=0):
+        super().__init__(verbose)
+        self.save_freq = save_freq
+        self.paths = checkpoint_paths(checkpoint_dir, model_name)
+        self.reward_logger = reward_logger
+        self.last_save = 0
+
+    def _init_callback(self) -> None:
+        self.paths["meta"].parent.mkdir(parents=True, exist_ok=True)
+        self.last_save = self.num_timesteps
+
+    def _on_step(self) -> bool:
+        if self.num_timesteps - self.last_save >= self.save_freq:
+            self.save()
+        return True
+
+    def save(self):
+        model_tmp = self.paths["model"].with_suffix(".tmp.zip")
+        self.model.save(str(model_tmp))
+        os.replace(model_tmp, self.paths["model"])
+
+        if hasattr(self.model, "replay_buffer") and self.model.replay_buffer is not None:
+            buffer_tmp = self.paths["replay_buffer"].with_suffix(".tmp.pkl")
+            self.model.save_replay_buffer(str(buffer_tmp))
+            os.replace(buffer_tmp, self.paths["replay_buffer"])
+
+        if self.reward_logger is not None:
+            rewards_tmp = self.paths["rewards"].with_suffix(".tmp.csv")
+            self.reward_logger.save_to_csv(rewards_tmp)
+            os.replace(rewards_tmp, self.paths["rewards"])
+
+        meta_tmp = self.paths["meta"].with_suffix(".tmp.json")
+        meta_tmp.write_text(json.dumps({"num_timesteps": self.num_timesteps}))
+        os.replace(meta_tmp, self.paths["meta"])
+        self.last_save = self.num_timesteps
+        if self.verbose:
+            print(f"[Checkpoint] {self.paths['model'].stem} saved at {self.num_timesteps} steps")
+
+
+class TrainingTelemetryCallback(BaseCallback):
+    """
+    Records where training time goes and how every env's episodes go, at a few array operations per step.
+    Per rollout: env steps/s, rollout (collection) time and the time of the gradient update that followed it
+    (NaN until it has been measured, at the next rollout or the end of training).
+    Per finished episode of any env: return, length and time in range (70-180 mg/dL).
+    Rows go into preallocated ring buffers that are appended to <prefix>_rollouts.csv and
+    <prefix>_episodes.csv whenever chunk_size rows have accumulated, and at the end of training.
+    Both files start empty unless resume is set, in which case a resumed run continues them.
+    """
+    ROLLOUT_FIELDS = [("timesteps", np.int64), ("rollout_s", np.float64), ("update_s", np.float64),
+                      ("steps_per_s", np.float64)]
+    EPISODE_FIELDS = [("timesteps", np.int64), ("env", np.int32), ("return", np.float64),
+                      ("length", np.int32), ("tir", np.float64)]
+
+    def __init__(self, output_dir: Path, prefix, chunk_size=1024, target_range=(70, 180), resume=False,
+                 verbose=0):
+        super().__init__(verbose)
+        self.output_dir = Path(output_dir)
+        self.prefix = prefix
+        self.resume = resume
+        self.chunk_size = chunk_size
+        self.target_range = target_range
+        self.rollouts = np.zeros(chunk_size, dtype=self.ROLLOUT_FIELDS)
+        self.episodes = np.zeros(chunk_size, dtype=self.EPISODE_FIELDS)
+        self.n_rollouts = 0
+        self.n_episodes = 0
+        self.rollout_start = None
+        self.rollout_end = None
+        self.rollout_start_steps = 0
+        # The last rollout's row is still waiting for the update that follows it
+        self.awaiting_update = False
+
+    def _init_callback(self) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if not self.resume:
+            for name in ("rollouts", "episodes"):
+                self._path(name).unlink(missing_ok=True)
+        n_envs = self.training_env.num_envs
+        self.episode_return = np.zeros(n_envs)
+        self.episode_length = np.zeros(n_envs, dtype=np.int32)
+        self.episode_in_range = np.zeros(n_envs, dtype=np.int32)
+
+    def _record_update(self, now):
+        # Everything between the end of a rollout and the next rollout (or the end of training) is the
+        # algorithm's gradient update on that rollout
+        if self.awaiting_update:
+            self.rollouts[self.n_rollouts - 1]["update_s"] = now - self.rollout_end
+            self.awaiting_update = False
+
+    def _on_rollout_start(self) -> None:
+        now = time.perf_counter()
+        self._record_update(now)
+        # A full buffer is only written once its last row has its update
+        if self.n_rollouts == self.chunk_size:
+            self.flush_rollouts()
+        self.rollout_start = now
+        self.rollout_start_steps = self.num_timesteps
+
+    def _on_rollout_end(self) -> None:
+        self.rollout_end = time.perf_counter()
+        elapsed = self.rollout_end - self.rollout_start
+        steps = self.num_timesteps - self.rollout_start_steps
+        row = self.rollouts[self.n_rollouts]
+        row["timesteps"] = self.num_timesteps
+        row["rollout_s"] = elapsed
+        row["update_s"] = np.nan
+        row["steps_per_s"] = steps / elapsed if elapsed > 0 else np.nan
+        self.n_rollouts += 1
+        self.awaiting_update = True
+
+    def _on_step(self) -> bool:
+        rewards = self.locals["rewards"]
+        dones = self.locals["dones"]
+        glucose = np.asarray(self.locals["new_obs"], dtype=np.float64).reshape(len(rewards), -1)[:, 0]
+        # The obs of a finished episode is already the next reset's, the last one is in its info
+        for i in np.flatnonzero(dones):
+            terminal = self.locals["infos"][i].get("terminal_observation")
+            if terminal is not None:
+                glucose[i] = np.asarray(terminal).ravel()[0]
+
+        low, high = self.target_range
+        self.episode_return += rewards
+        self.episode_length += 1
+        self.episode_in_range += (glucose >= low) & (glucose <= high)
+
+        for i in np.flatnonzero(dones):
+            row = self.episodes[self.n_episodes]
+            row["timesteps"] = self.num_timesteps
+            row["env"] = i
+            row["return"] = self.episode_return[i]
+            row["length"] = self.episode_length[i]
+            row["tir"] = 100.0 * self.episode_in_range[i] / self.episode_length[i]
+            self.episode_return[i] = 0.0
+            self.episode_length[i] = 0
+            self.episode_in_range[i] = 0
+            self.n_episodes += 1
+            if self.n_episodes == self.chunk_size:
+                self.flush_episodes()
+        return True
+
+    def _on_training_end(self) -> None:
+        self._record_update(time.perf_counter())
+        self.flush_rollouts()
+        self.flush_episodes()
+
+    def _path(self, name):
+        return self.output_dir / f"{self.prefix}_{name}.csv"
+
+    def _append(self, rows, name):
+        path = self._path(name)
+        pd.DataFrame(rows).to_csv(path, mode="a", header=not path.exists(), index=False)
+
+    def flush_rollouts(self):
+        if self.n_rollouts:
+            self._append(self.rollouts[:self.n_rollouts], "rollouts")
+            self.n_rollouts = 0
+
+    def flush_episodes(self):
+        if self.n_episodes:
+            self._append(self.episodes[:self.n_episodes], "episodes")
+            self.n_episodes = 0
@@ -0,0 +1,106 @@
+import os
+import sys
+import multiprocessing
+import multiprocessing.util
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from CoreLogic.simulation_core import (
+    SimulationConfig, MealGenerator, BatchSimulationRunner, MetricsCalculator,
+    create_batch_environments, list_patient_names, load_model_from_file, get_model_path, EnvironmentPool
+)
+from CoreLogic.numpy_policy import has_numpy_policies, load_numpy_policies
+
+# Models of the current worker process, loaded once by _init_worker
+_WORKER_STATE = {}
+
+
+def _init_worker(model_dir, model_type, quiet, scenario_bank=None):
+    if quiet:
+        # Every worker would repeat the model-loading messages (load_model_from_file) in the parent's console
+        sys.stdout = open(os.devnull, "w")
+    # Pool workers leave through multiprocessing's exit handlers (not atexit), which run Finalize callbacks
+    multiprocessing.util.Finalize(None, EnvironmentPool.clear, exitpriority=10)
+    _WORKER_STATE["config"] = SimulationConfig(model_type=model_type)
+    _WORKER_STATE["config"].scenario_bank = scenario_bank
+    # Exported NumPy policies keep torch out of the workers
+    if has_numpy_policies(model_dir):
+        _WORKER_STATE["models"] = list(load_numpy_policies(model_dir))
+    else:
+        _WORKER_STATE["models"] = [
+            load_model_from_file(get_model_path(Path(model_dir), name), model_type, env=None)
+            for name in ("lowmodel", "innermodel", "highmodel")
+        ]
+
+
+def _run_task(patient_name, day_indices, seed, keep_logs=False):
+    """
+    Simulates one patient over several meal days in lockstep and returns one result dict per day
+    """
+    config = SimulationConfig(model_type=_WORKER_STATE["config"].model_type, patient_name=patient_name)
+    config.scenario_bank = _WORKER_STATE["config"].scenario_bank
+    config.render_sim = False
+    config.save_video = False
+    bw = config.get_patient_params()["bw"]
+
+    meal_gen = MealGenerator(config)
+    # With a scenario bank every patient and model set sees the same meal day for the same day index
+    scenarios = meal_gen.create_meal_scenarios(bw, len(day_indices), seed=seed, start_index=day_indices[0])
+    envs = create_batch_environments([(patient_name, scenario) for scenario, _ in scenarios],
+                                     max_episode_steps=config.max_episode_steps,
+                                     seeds=[seed + i for i in range(len(day_indices))])
+
+    # The envs stay in the worker's EnvironmentPool for the next task, they are closed at worker exit
+    runner = BatchSimulationRunner(envs, *_WORKER_STATE["models"], config)
+    runner.run()
+
+    metrics = MetricsCalculator(None).calculate_many(runner.log_data)
+    return [
+        {
+            "patient": patient_name,
+            "day": day,
+            "meals": scenarios[i][1],
+            "metrics": metrics.iloc[i].to_dict(),
+            "log": runner.run_log(i) if keep_logs else None,
+        }
+        for i, day in enumerate(day_indices)
+    ]
+
+
+class CohortRunner:
+    """
+    Fans a trained model set out over every simglucose virtual patient and many meal days
+    on a process pool, streaming per-run results back as they finish.
+    """
+    def __init__(self, model_dir: Path, model_type="PPO", patient_names=None, n_days=10,
+                 days_per_task=5, max_workers=None, seed=0, quiet=True, keep_logs=False,
+                 scenario_bank=None):
+        self.model_dir = Path(model_dir)
+        self.model_type = model_type
+        self.patient_names = patient_names or list_patient_names()
+        self.n_days = n_days
+        self.days_per_task = days_per_task
+        self.max_workers = max_workers or os.cpu_count()
+        self.seed = seed
+        self.quiet = quiet
+        self.keep_logs = keep_logs
+        self.scenario_bank = str(scenario_bank) if scenario_bank is not None else None
+
+    def _tasks(self):
+        for p, patient_name in enumerate(self.patient_names):
+            for start in range(0, self.n_days, self.days_per_task):
+                days = list(range(start, min(start + self.days_per_task, self.n_days)))
+                yield patient_name, days, self.seed * 1_000_003 + p * self.n_days + start
+
+    def run(self):
+        """
+        Yields one result dict per (patient, day) in completion order
+        """
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(str(self.model_dir), self.model_type, self.quiet,
+                                           self.scenario_bank)) as pool:
+            futures = [pool.submit(_run_task, *task, keep_logs=self.keep_logs) for task in self._tasks()]
+            for future in as_completed(futures):
+                yield from future.result()
@@ -1,159 +1,335 @@
-from pathlib import Path
-from PIL import ImageGrab
-import imageio
-import time
+import logging
 import numpy as np
-import gymnasium
-from gymnasium.envs.registration import register
-from simglucose.simulation.scenario import CustomScenario
-from datetime import datetime
-from stable_baselines3 import PPO
-from stable_baselines3.common.env_util import make_vec_env
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from simglucose.envs import T1DSimGymnaisumEnv
+from simglucose.simulation.rendering import Viewer
 from datetime import datetime, timedelta
+from CoreLogic.patient_batch import make_patient, fast_forward_patient, patient_state, restore_patient_state
+from CoreLogic.rewards import (compile_reward, risk_index, CUSTOM_REWARD, LOW_GLUCOSE_REWARD, HIGH_GLUCOSE_REWARD,
+                               INNER_GLUCOSE_REWARD)
 
-class CustomT1DSimGymnaisumEnv(T1DSimGymnaisumEnv):
+logger = logging.getLogger(__name__)
+
+class OffscreenViewer(Viewer):
+    """
+    simglucose's Viewer drawn on an Agg canvas instead of a pyplot window,
+    so frames can be captured on machines without a display.
+    """
+    def initialize(self):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(4)
+
+        axes[0].set_ylabel('BG (mg/dL)')
+        axes[1].set_ylabel('CHO (g/min)')
+        axes[2].set_ylabel('Insulin (U/min)')
+        axes[3].set_ylabel('Risk Index')
+
+        lineBG, = axes[0].plot([], [], label='BG')
+        lineCGM, = axes[0].plot([], [], label='CGM')
+        lineCHO, = axes[1].plot([], [], label='CHO')
+        lineIns, = axes[2].plot([], [], label='Insulin')
+        lineLBGI, = axes[3].plot([], [], label='Hypo Risk')
+        lineHBGI, = axes[3].plot([], [], label='Hyper Risk')
+        lineRI, = axes[3].plot([], [], label='Risk Index')
+        lines = [lineBG, lineCGM, lineCHO, lineIns, lineLBGI, lineHBGI, lineRI]
+
+        axes[0].set_ylim([70, 180])
+        axes[1].set_ylim([-5, 30])
+        axes[2].set_ylim([-0.5, 1])
+        axes[3].set_ylim([0, 5])
+        for ax in axes:
+            ax.set_xlim([self.start_time, self.start_time + timedelta(hours=3)])
+            ax.legend()
+
+        axes[0].axhspan(70, 180, alpha=0.3, color='limegreen', lw=0)
+        axes[0].axhspan(50, 70, alpha=0.3, color='red', lw=0)
+        axes[0].axhspan(0, 50, alpha=0.3, color='darkred', lw=0)
+        axes[0].axhspan(180, 250, alpha=0.3, color='red', lw=0)
+        axes[0].axhspan(250, 1000, alpha=0.3, color='darkred', lw=0)
+
+        axes[0].tick_params(labelbottom=False)
+        axes[1].tick_params(labelbottom=False)
+        axes[2].tick_params(labelbottom=False)
+        axes[3].xaxis.set_minor_locator(mdates.AutoDateLocator())
+        axes[3].xaxis.set_minor_formatter(mdates.DateFormatter('%H:%M\n'))
+        axes[3].xaxis.set_major_locator(mdates.DayLocator())
+        axes[3].xaxis.set_major_formatter(mdates.DateFormatter('\n%b %d'))
+        axes[0].set_title(self.patient_name)
+        return fig, axes, lines
+
+    def frame(self):
+        """
+        Returns the current canvas as an (height, width, 3) uint8 array
+        """
+        return np.asarray(self.fig.canvas.buffer_rgba())[..., :3].copy()
+
+
+class ReusableT1DSimEnv(T1DSimGymnaisumEnv):
+    """
+    T1DSimGymnaisumEnv that can be reused for a new day instead of rebuilt.
+    reset(options={"scenario": ..., "patient_name": ...}) swaps the meal scenario and/or patient in place,
+    reset(seed=...) reseeds the patient's initial glucose and the sensor noise like a fresh env with that seed.
+    """
     metadata = {'render_modes': ['human', 'rgb_array'], 'render_fps': 20}
+    # RewardSpec (CoreLogic.rewards) replacing simglucose's reward, None keeps it
+    REWARD = None
+    START_TIME = datetime(2025, 1, 1, 0, 0, 0)#Szimuláció kezdő ideje éjfél
+    SAMPLE_MINUTES = 3
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, backend="scipy", **kwargs):
         super().__init__(*args, **kwargs)
-        self.current_time = datetime(2025, 1, 1, 0, 0, 0)#Szimuláció kezdő ideje éjfél
+        self.current_time = self.START_TIME
         self.last_blood_glucose = None
+        self.reward_fn = compile_reward(self.REWARD) if self.REWARD is not None else None
+        # Patient dynamics: "scipy" is simglucose's own solver, "numpy" the RK4 backend in CoreLogic.patient_batch
+        self.backend = backend
+        if backend != "scipy":
+            patient = self.env.env.patient
+            self.env.env.patient = make_patient(patient._params, backend, random_init_bg=True, seed=patient.seed)
 
-    def step(self, action):
-        observation, reward, terminated, truncated, info = super().step(action)
-        blood_glucose = observation[0]  
-        target_bg = 120  
-        bg_tolerance = 20         
-        self.current_time += timedelta(minutes=3)
-        deviation = abs(blood_glucose - target_bg)
-
-        #00:00 és 06:00 közötti szigorúbb bünti       
-        if self.current_time.hour < 6:
-            if blood_glucose > 160:
-                reward -= 1.5
-            elif 100 <= blood_glucose <=150:
-                reward += 0.7
-        
-        if blood_glucose > target_bg + bg_tolerance:
-            reward -= 0.5 * (deviation / 10) 
-        elif blood_glucose < target_bg - bg_tolerance:
-            reward -= 0.5 * (deviation / 10) 
-        else:
-            reward += 0.5 
-
-        # Penalty for glycemic variability
-        if self.last_blood_glucose is not None:
-            fluctuation = abs(blood_glucose - self.last_blood_glucose)
-            reward -= 0.05 * fluctuation # Penalize large glucose swings
-        self.last_blood_glucose = blood_glucose
+    def set_scenario(self, scenario):
+        self.env.custom_scenario = scenario
+        self.env.env.scenario = scenario
 
-        
-        print(f"[{self.current_time.strftime('%H:%M')}] Blood Glucose: {blood_glucose}, Reward: {reward}")
+    def set_patient(self, patient_name):
+        """
+        Replaces the patient with one built from the cached parameter table (no CSV read)
+        """
+        from CoreLogic.simulation_core import patient_params_table
 
-        return observation, reward, terminated, truncated, info
- 
-class LowGlucoseEnv(T1DSimGymnaisumEnv):
-    metadata = {'render_modes': ['human', 'rgb_array'], 'render_fps': 20}
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+        sim = self.env.env
+        if patient_name == sim.patient.name:
+            return
+        params = patient_params_table().loc[patient_name]
+        sim.patient = make_patient(params, self.backend, random_init_bg=True, seed=sim.patient.seed)
+        self.env.patient_name = patient_name
+
+    def reseed(self, seed):
+        """
+        Derives patient and sensor seeds the same way simglucose does when it builds an env with this seed
+        """
+        from gym.utils import seeding
+
+        self.env.np_random, _ = seeding.np_random(seed=seed)
+        seed2 = seeding.hash_seed(self.env.np_random.randint(0, 1000)) % 2**31
+        seed3 = seeding.hash_seed(seed2 + 1) % 2**31
+        seed4 = seeding.hash_seed(seed3 + 1) % 2**31
+        self.env.env.sensor.seed = seed2
+        self.env.env.patient.seed = seed4
+
+    def reset(self, seed=None, options=None):
+        options = options or {}
+        if options.get("patient_name") is not None:
+            self.set_patient(options["patient_name"])
+        if options.get("scenario") is not None:
+            self.set_scenario(options["scenario"])
+        if seed is not None:
+            self.reseed(seed)
+        self.current_time = self.START_TIME
         self.last_blood_glucose = None
+        return super().reset(seed=seed)
 
     def step(self, action):
         observation, reward, terminated, truncated, info = super().step(action)
         blood_glucose = observation[0]
-        reward = -0.01  # Small penalty for every step to encourage action
-
-        # Goal: Avoid hypoglycemia (< 70 mg/dL) at all costs.
-        if blood_glucose < 70:
-            deviation = 70 - blood_glucose
-            reward -= 1.0 + (deviation ** 1.5) / 10.0 # Severe, escalating penalty for being low
-        elif blood_glucose < 80:
-            # Warning zone penalty
-            reward -= 0.5
-        elif blood_glucose > 180:
-            # Mild penalty for being high, as this is not the primary focus
-            reward -= (blood_glucose - 180) / 200.0
-        else: # 80 <= BG <= 180
-            # Reward for being in a safe, non-low range
-            reward += 0.1
-
-        # Penalize any insulin action when BG is low or dropping towards low
-        if action[0] > 0 and blood_glucose < 100:
-            reward -= 2.0 * action[0] # Strong penalty for incorrect action
-
-        # Penalty for glycemic variability
-        if self.last_blood_glucose is not None:
-            fluctuation = abs(blood_glucose - self.last_blood_glucose)
-            reward -= 0.05 * fluctuation # Penalize large glucose swings
+        self.current_time += timedelta(minutes=self.SAMPLE_MINUTES)
+
+        if self.reward_fn is not None:
+            previous = np.nan if self.last_blood_glucose is None else self.last_blood_glucose
+            reward = float(self.reward_fn(blood_glucose, action[0], previous, self.current_time.hour, reward))
         self.last_blood_glucose = blood_glucose
 
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[%s] %s Blood Glucose: %s, Reward: %s", self.current_time.strftime('%H:%M'),
+                         type(self).__name__, blood_glucose, reward)
         return observation, reward, terminated, truncated, info
 
-class HighGlucoseEnv(T1DSimGymnaisumEnv):
+
+    def snapshot(self):
+        """
+        Copies the run state: patient, sensor noise, the simulator's history and this env's clock.
+        The pump holds no state and scenarios are not modified by a run, so they are kept by reference.
+        """
+        sim = self.env.env
+        return {
+            "patient": sim.patient,
+            "patient_state": patient_state(sim.patient),
+            "sensor": _sensor_state(sim.sensor),
+            "scenario": sim.scenario,
+            "history": {name: list(getattr(sim, name)) for name in HISTORY_FIELDS},
+            "current_time": self.current_time,
+            "last_blood_glucose": self.last_blood_glucose,
+        }
+
+    def restore(self, snapshot):
+        sim = self.env.env
+        sim.patient = snapshot["patient"]
+        self.env.patient_name = sim.patient.name
+        restore_patient_state(sim.patient, snapshot["patient_state"])
+        _restore_sensor_state(sim.sensor, snapshot["sensor"])
+        sim.scenario = self.env.custom_scenario = snapshot["scenario"]
+        for name, values in snapshot["history"].items():
+            setattr(sim, name, list(values))
+        self.current_time = snapshot["current_time"]
+        self.last_blood_glucose = snapshot["last_blood_glucose"]
+
+    def meal_due(self, minutes):
+        """
+        True while the patient is eating or when the scenario serves a meal within the next `minutes`
+        """
+        sim = self.env.env
+        if sim.patient.is_eating or sim.patient.planned_meal > 0:
+            return True
+        now = sim.time
+        return any(sim.scenario.get_action(now + timedelta(minutes=m)).meal > 0 for m in range(minutes))
+
+    def fast_forward(self, n_steps, action=0.0):
+        """
+        Advances n_steps sample periods at a constant action with one long integration instead of
+        minute-by-minute steps. Only valid while no meal is due (see meal_due).
+        Glucose between the current and the final state is interpolated linearly. The sensor draws one
+        noise sample per skipped step, as regular steps do, so its noise stream stays in step with an
+        unskipped run. Rewards, risk and the simulator's history are filled in so logs keep one row per step.
+        Returns (observations, rewards, risks, terminated). When glucose leaves 10-600 mg/dL the arrays end
+        at that step and terminated is True.
+        """
+        sim = self.env.env
+        sensor = sim.sensor
+        action = float(np.asarray(action).ravel()[0])
+        insulin = sim.pump.basal(action)
+        start_point = sim.patient.observation.Gsub
+        start_time = sim.time
+
+        fast_forward_patient(sim.patient, n_steps * sim.sample_time, insulin)
+        end_point = sim.patient.observation.Gsub
+
+        # Gsub at the end of each step, and the step averages simglucose reports (minutes k-2/3, k-1/3, k)
+        steps = np.arange(1, n_steps + 1)
+        points = start_point + (end_point - start_point) * steps / n_steps
+        bg = start_point + (end_point - start_point) * (steps - 1 / 3) / n_steps
+        # The sensor samples once per step, at its last minute, and holds the reading for the other two
+        noise = np.array([next(sensor._noise_generator) for _ in range(n_steps)])
+        readings = np.clip(points + noise, sensor._params["min"], sensor._params["max"])
+        held = np.concatenate([[sensor._last_CGM], readings[:-1]])
+        cgm = ((2 * held + readings) / 3).astype(np.float32)
+        sensor._last_CGM = readings[-1]
+
+        out_of_range = np.flatnonzero((bg < 10) | (bg > 600))
+        terminated = len(out_of_range) > 0
+        if terminated:
+            n_steps = int(out_of_range[0]) + 1
+            bg, cgm = bg[:n_steps], cgm[:n_steps]
+
+        lbgi, hbgi, risk = risk_index(bg)
+        cgm_risk = risk_index(np.concatenate([[sim.CGM_hist[-1]], cgm]))[2]
+        env_rewards = cgm_risk[:-1] - cgm_risk[1:]  # simglucose's risk_diff on the CGM history
+
+        times = [start_time + timedelta(minutes=int(sim.sample_time * k)) for k in range(1, n_steps + 1)]
+        sim.time_hist.extend(times)
+        sim.BG_hist.extend(bg.tolist())
+        sim.CGM_hist.extend(cgm.tolist())
+        sim.risk_hist.extend(risk.tolist())
+        sim.LBGI_hist.extend(lbgi.tolist())
+        sim.HBGI_hist.extend(hbgi.tolist())
+        sim.CHO_hist.extend([0.0] * n_steps)
+        sim.insulin_hist.extend([insulin] * n_steps)
+
+        hours = np.array([(self.current_time + timedelta(minutes=self.SAMPLE_MINUTES * k)).hour
+                          for k in range(1, n_steps + 1)])
+        self.current_time += timedelta(minutes=self.SAMPLE_MINUTES * n_steps)
+        rewards = env_rewards
+        if self.reward_fn is not None:
+            previous = np.concatenate([[np.nan if self.last_blood_glucose is None else self.last_blood_glucose],
+                                       cgm[:-1]])
+            rewards = self.reward_fn(cgm, np.full(n_steps, action), previous, hours, env_rewards)
+        self.last_blood_glucose = cgm[-1]
+        return cgm, rewards, risk, terminated
+
+
+# Per-step history lists of simglucose's simulation env
+HISTORY_FIELDS = ("time_hist", "BG_hist", "CGM_hist", "risk_hist", "LBGI_hist", "HBGI_hist", "CHO_hist",
+                  "insulin_hist")
+
+
+def _sensor_state(sensor):
+    """
+    CGMSensor's noise position: the interpolated 3-minute sequence and the 15-minute generator's RNG
+    """
+    noise = sensor._noise_generator
+    generator = noise._noise15_gen
+    return (sensor._last_CGM, noise.count, noise._noise_init, list(noise.noise),
+            generator.rand_gen.get_state(), generator.e, generator.count)
+
+
+def _restore_sensor_state(sensor, state):
+    from collections import deque
+
+    noise = sensor._noise_generator
+    generator = noise._noise15_gen
+    sensor._last_CGM, noise.count, noise._noise_init, sequence, rng_state, generator.e, generator.count = state
+    noise.noise = deque(sequence)
+    generator.rand_gen.set_state(rng_state)
+
+
+class CustomT1DSimGymnaisumEnv(ReusableT1DSimEnv):
     metadata = {'render_modes': ['human', 'rgb_array'], 'render_fps': 20}
+    REWARD = CUSTOM_REWARD
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.last_blood_glucose = None
+        self._offscreen_viewer = None
 
-    def step(self, action):
-        observation, reward, terminated, truncated, info = super().step(action)
-        blood_glucose = observation[0]
-        reward = -0.01 # Small penalty for every step to encourage action
-
-        # Goal: Bring high glucose down, avoid going > 180 mg/dL
-        if blood_glucose > 180:
-            deviation = blood_glucose - 180
-            reward -= 0.5 + (deviation / 100.0) # Strong penalty for being high
-        elif blood_glucose < 70:
-            # Also penalize hypoglycemia, though it's not the main focus
-            reward -= 1.5
-        else: # 70 <= BG <= 180
-            # Reward for being in the target range
-            reward += 0.1
-
-        # Penalize inaction when BG is high
-        if action[0] == 0 and blood_glucose > 160:
-            reward -= 2.0
-
-        # Penalty for glycemic variability
-        if self.last_blood_glucose is not None:
-            fluctuation = abs(blood_glucose - self.last_blood_glucose)
-            reward -= 0.05 * fluctuation # Penalize large glucose swings
-        self.last_blood_glucose = blood_glucose
+    def reset(self, seed=None, options=None):
+        if options and self._offscreen_viewer is not None:
+            # The viewer's title and time axis belong to the previous patient/scenario
+            self._offscreen_viewer.close()
+            self._offscreen_viewer = None
+        return super().reset(seed=seed, options=options)
 
-        return observation, reward, terminated, truncated, info
+    def render_frame(self):
+        """
+        Draws the simulation history offscreen and returns it as an RGB array, independent of render_mode
+        """
+        sim = self.env.env
+        if self._offscreen_viewer is None:
+            self._offscreen_viewer = OffscreenViewer(sim.scenario.start_time, sim.patient.name)
+        self._offscreen_viewer.render(sim.show_history())
+        return self._offscreen_viewer.frame()
 
-class InnerGlucoseEnv(T1DSimGymnaisumEnv):
+    def render(self):
+        if self.render_mode == "rgb_array":
+            return self.render_frame()
+        return super().render()
+
+    def close(self):
+        if self._offscreen_viewer is not None:
+            self._offscreen_viewer.close()
+            self._offscreen_viewer = None
+        super().close()
+
+
+class LowGlucoseEnv(ReusableT1DSimEnv):
+    """
+    Goal: avoid hypoglycemia (< 70 mg/dL) at all costs, see LOW_GLUCOSE_REWARD
+    """
     metadata = {'render_modes': ['human', 'rgb_array'], 'render_fps': 20}
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.last_blood_glucose = None
+    REWARD = LOW_GLUCOSE_REWARD
 
-    def step(self, action):
-        observation, reward, terminated, truncated, info = super().step(action)
-        blood_glucose = observation[0]
-        reward = -0.01 # Small penalty for every step to encourage action
-
-        # Goal: Maintain tight control within 70-130 mg/dL
-        target_bg = 100
-        if 70 <= blood_glucose <= 130:
-            # Quadratic reward, highest at the target_bg
-            reward += 0.2 - 0.0005 * ((blood_glucose - target_bg) ** 2)
-        elif blood_glucose < 70:
-            reward -= 1.5 + (70 - blood_glucose) / 10.0 # Strong penalty for hypo
-        else: # blood_glucose > 130
-            reward -= 0.5 + (blood_glucose - 130) / 100.0 # Strong penalty for hyper
-
-        # Penalize large insulin doses to encourage fine-tuning
-        if action[0] > 0.5:
-            reward -= 0.2 * action[0]
-
-        # Penalty for glycemic variability
-        if self.last_blood_glucose is not None:
-            fluctuation = abs(blood_glucose - self.last_blood_glucose)
-            reward -= 0.05 * fluctuation # Penalize large glucose swings
-        self.last_blood_glucose = blood_glucose
 
-        return observation, reward, terminated, truncated, info
-    
\ No newline at end of file
+class HighGlucoseEnv(ReusableT1DSimEnv):
+    """
+    Goal: bring high glucose down, avoid going > 180 mg/dL, see HIGH_GLUCOSE_REWARD
+    """
+    metadata = {'render_modes': ['human', 'rgb_array'], 'render_fps': 20}
+    REWARD = HIGH_GLUCOSE_REWARD
+
+
+class InnerGlucoseEnv(ReusableT1DSimEnv):
+    """
+    Goal: maintain tight control within 70-130 mg/dL, see INNER_GLUCOSE_REWARD
+    """
+    metadata = {'render_modes': ['human', 'rgb_array'], 'render_fps': 20}
+    REWARD = INNER_GLUCOSE_REWARD
@@ -0,0 +1,160 @@
+import sys
+import numpy as np
+from pathlib import Path
+from CoreLogic.lime_explainer import Predictor
+
+# The regime policies see one glucose value and the regime is a fixed function of it, so a model set
+# is a 1-D map from glucose to dose. compile_dose_table samples each regime's policy over its own
+# glucose interval, refines the grid until linear interpolation matches the live policy within a
+# tolerance at midpoints and random readings, and the resulting TablePolicy objects stand in for the
+# models with no network evaluation.
+
+TABLE_NAME = "dose_table.npz"
+REGIMES = ("low", "inner", "high")
+# The CGM reports 39-600 mg/dL; readings outside the range get the dose at its edge
+GLUCOSE_RANGE = (20.0, 600.0)
+
+
+def regime_bounds(glucose_range=GLUCOSE_RANGE):
+    """
+    Closed interval each regime model is sampled on: low <= 70 < inner <= 130 < high
+    """
+    low, high = glucose_range
+    inner, upper = float(Predictor.INNER_ABOVE), float(Predictor.HIGH_ABOVE)
+    return {"low": (low, inner), "inner": (inner, upper), "high": (upper, high)}
+
+
+class TablePolicy:
+    """
+    Interpolated dose of one regime model. predict() mirrors BaseAlgorithm.predict like NumpyPolicy.
+    """
+    def __init__(self, glucose, dose):
+        self.glucose = glucose
+        self.dose = dose
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        obs = np.asarray(observation, dtype=np.float32)
+        vectorized = obs.ndim > 1
+        actions = np.interp(obs.reshape(len(obs) if vectorized else 1, -1)[:, 0], self.glucose, self.dose)
+        actions = actions.astype(np.float32)[:, None]
+        if not vectorized:
+            actions = actions[0]
+        return actions, state
+
+
+class DoseTable:
+    """
+    TablePolicy per regime plus how the table was compiled (tolerance, max_error on random checks)
+    """
+    def __init__(self, policies, meta):
+        self.policies = policies
+        self.meta = meta
+
+    @property
+    def models(self):
+        """
+        (lowmodel, innermodel, highmodel) for SimulationRunner, Predictor and the Flask app
+        """
+        return tuple(self.policies[regime] for regime in REGIMES)
+
+    def dose(self, glucose):
+        glucose = np.asarray(glucose, dtype=np.float64)
+        doses = np.zeros(glucose.shape)
+        for regime, mask in Predictor.regime_masks(glucose).items():
+            policy = self.policies[regime]
+            doses[mask] = np.interp(glucose[mask], policy.glucose, policy.dose)
+        return doses
+
+    def save(self, base_dir: Path, filename=TABLE_NAME):
+        arrays = {f"meta.{key}": np.asarray(value) for key, value in self.meta.items()}
+        for regime, policy in self.policies.items():
+            arrays[f"{regime}.glucose"] = policy.glucose
+            arrays[f"{regime}.dose"] = policy.dose
+        path = Path(base_dir) / filename
+        np.savez_compressed(path, **arrays)
+        print(f"[Model I/O] Saved dose table to {path}")
+        return path
+
+
+def _sample(model, glucose):
+    """
+    Deterministic dose of model at each glucose value, as the runner would call it
+    """
+    action, _ = model.predict(glucose.reshape(-1, 1).astype(np.float32), deterministic=True)
+    return np.asarray(action, dtype=np.float64).reshape(len(glucose), -1)[:, 0]
+
+
+def _observation_size(model):
+    if hasattr(model, "obs_dim"):
+        return model.obs_dim
+    if hasattr(model, "observation_space"):
+        return int(np.prod(model.observation_space.shape))
+    return 1
+
+
+def compile_dose_table(models, step=1.0, tolerance=1e-3, max_refinements=12, n_checks=2000,
+                       glucose_range=GLUCOSE_RANGE, seed=0):
+    """
+    Samples (lowmodel, innermodel, highmodel) every `step` mg/dL, then refines the grid where
+    interpolation is off by more than `tolerance` (U/min): at interval midpoints and at n_checks random
+    readings, each miss becoming a grid point. Raises ValueError when the table still misses the live
+    policies after max_refinements rounds or on n_checks fresh random readings.
+    Policies see glucose only, so the table has no meal axis.
+    """
+    rng = np.random.default_rng(seed)
+    policies = {}
+    max_error = 0.0
+    for regime, model in zip(REGIMES, models):
+        if _observation_size(model) != 1:
+            raise ValueError(f"{regime} model observes {_observation_size(model)} values, dose tables need glucose only")
+        low, high = regime_bounds(glucose_range)[regime]
+        # Grid points are float32 values, the precision the policies see them at
+        glucose = np.linspace(low, high, int(np.ceil((high - low) / step)) + 1).astype(np.float32).astype(np.float64)
+        dose = _sample(model, glucose)
+        checks = rng.uniform(low, high, n_checks).astype(np.float32).astype(np.float64)
+        check_dose = _sample(model, checks)
+        for refinement in range(max_refinements + 1):
+            mids = ((glucose[:-1] + glucose[1:]) / 2).astype(np.float32).astype(np.float64)
+            probes = np.concatenate([mids, checks])
+            live = np.concatenate([_sample(model, mids), check_dose])
+            missed = np.abs(np.interp(probes, glucose, dose) - live) > tolerance
+            if not missed.any():
+                break
+            if refinement == max_refinements:
+                raise ValueError(f"{regime} dose table misses the policy by more than {tolerance} "
+                                 f"after {max_refinements} refinements")
+            glucose, index = np.unique(np.concatenate([glucose, probes[missed]]), return_index=True)
+            dose = np.concatenate([dose, live[missed]])[index]
+
+        # The refinement checks are grid points by now where they mattered, the reported error uses new ones
+        checks = rng.uniform(low, high, n_checks).astype(np.float32).astype(np.float64)
+        error = np.abs(np.interp(checks, glucose, dose) - _sample(model, checks)).max()
+        if error > tolerance:
+            raise ValueError(f"{regime} dose table is off by {error:.2e} on random readings (tolerance {tolerance})")
+        max_error = max(max_error, float(error))
+        policies[regime] = TablePolicy(glucose, dose)
+
+    meta = {"tolerance": tolerance, "max_error": max_error, "step": step,
+            "glucose_low": glucose_range[0], "glucose_high": glucose_range[1]}
+    return DoseTable(policies, meta)
+
+
+def has_dose_table(base_dir: Path, filename=TABLE_NAME):
+    return (Path(base_dir) / filename).exists()
+
+
+def load_dose_table(base_dir: Path, filename=TABLE_NAME):
+    with np.load(Path(base_dir) / filename) as data:
+        policies = {regime: TablePolicy(data[f"{regime}.glucose"], data[f"{regime}.dose"]) for regime in REGIMES}
+        meta = {key[len("meta."):]: data[key].item() for key in data.files if key.startswith("meta.")}
+    return DoseTable(policies, meta)
+
+
+if __name__ == "__main__":
+    # Usage: python -m CoreLogic.dose_table <model set directory> [A2C|PPO|TD3]
+    from CoreLogic.simulation_core import load_inference_model_set
+
+    model_dir = Path(sys.argv[1])
+    table = compile_dose_table(load_inference_model_set(model_dir, sys.argv[2] if len(sys.argv) > 2 else None))
+    table.save(model_dir)
+    print(f"{sum(len(p.glucose) for p in table.policies.values())} points, max error {table.meta['max_error']:.2e}")
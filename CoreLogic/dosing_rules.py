@@ -0,0 +1,52 @@
+import numpy as np
+
+# The runners' dosing rules as plain functions, so the lookahead controller can apply them to its
+# candidate branches without touching a runner's injection history. Everything works on scalars
+# and on arrays (one row per env or branch).
+
+MAX_INJECTIONS_PER_HOUR = 3
+
+
+def scale_dose(action, observation, risk):
+    """
+    Dose after the ultra-conservative rules for a sensitive pediatric patient, before the hourly limit
+    """
+    # 1. Extremely gentle risk-based scaling to avoid any sudden increases.
+    coefficient = 1 + (risk / 30)
+    # 2. A low cap on the model's output for fine-grained control.
+    action = np.minimum(action, 0.3) * coefficient
+    # 3. "Soft landing": a linear factor from 0.0 (at 100 mg/dL) to 1.0 (at 120 mg/dL), no dose below 100.
+    scaling_factor = np.where(observation < 120, np.maximum(0, (observation - 100) / 20), 1.0)
+    # 4. A hard maximum dose cap of 0.5 units as a final safety backstop.
+    return np.minimum(action * scaling_factor, 0.5)
+
+
+class InjectionLimit:
+    """
+    Minute of the last MAX_INJECTIONS_PER_HOUR doses per row (-inf when unused). A row may dose
+    while fewer of them fall within the past hour.
+    """
+    def __init__(self, n_rows, recent_minutes=()):
+        self.minutes = np.full((n_rows, MAX_INJECTIONS_PER_HOUR), -np.inf)
+        self._slot = np.zeros(n_rows, dtype=int)
+        for minute in sorted(recent_minutes)[-MAX_INJECTIONS_PER_HOUR:]:
+            self.record(np.ones(n_rows, dtype=bool), minute)
+
+    def allowed(self, minute):
+        return (self.minutes > minute - 60).sum(axis=1) < MAX_INJECTIONS_PER_HOUR
+
+    def record(self, injected, minute):
+        rows = np.flatnonzero(injected)
+        self.minutes[rows, self._slot[rows]] = minute
+        self._slot[rows] = (self._slot[rows] + 1) % MAX_INJECTIONS_PER_HOUR
+
+    def apply(self, actions, minute, active=None):
+        """
+        Zeroes the doses of rows at their limit and records the others' injections at minute
+        """
+        actions = np.where(self.allowed(minute), actions, 0.0)
+        injected = actions > 0
+        if active is not None:
+            injected &= active
+        self.record(injected, minute)
+        return actions
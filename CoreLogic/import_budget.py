@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+# Import time budgets in seconds, measured in a fresh interpreter per module
+IMPORT_BUDGETS = {
+    "CoreLogic.simulation_core": 1.0,
+    "CoreLogic.numpy_policy": 0.5,
+    "CoreLogic.lime_explainer": 0.5,
+    "CoreLogic.cohort_runner": 1.0,
+    "DoseWizard_FlaskApp.app": 1.5,
+}
+
+# Modules that must not be pulled in by a plain import of the modules above
+HEAVY_MODULES = ("torch", "stable_baselines3", "gymnasium", "simglucose", "matplotlib", "imageio", "PIL", "lime")
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, repo_root: Path = None):
+    """
+    Imports module in a new interpreter and returns (seconds, heavy modules loaded)
+    """
+    repo_root = repo_root or Path(__file__).resolve().parent.parent
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(repo_root), os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            capture_output=True, text=True, cwd=repo_root, env=env, check=True)
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data["seconds"], data["heavy"]
+
+
+def check_budgets(budgets=IMPORT_BUDGETS):
+    """
+    Prints every module's import time against its budget and returns True when all are within it
+    """
+    ok = True
+    for module, budget in budgets.items():
+        seconds, heavy = measure_import(module)
+        within = seconds <= budget
+        ok &= within
+        status = "OK  " if within else "SLOW"
+        print(f"{status} {module:<32} {seconds:6.3f}s / {budget:.1f}s  heavy: {', '.join(heavy) or '-'}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_budgets() else 1)
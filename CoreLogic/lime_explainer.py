@@ -1,5 +1,3 @@
-import lime
-import lime.lime_tabular
 import numpy as np
 
 class Predictor:
@@ -8,27 +6,45 @@ class Predictor:
         self.inner_model = inner_model
         self.high_model = high_model
 
+    REGIMES = ("low", "inner", "high")
+    # Glucose (mg/dL) where the inner and the high regime begin, both exclusive
+    INNER_ABOVE = 70
+    HIGH_ABOVE = 130
+
+    @classmethod
+    def regime_masks(cls, values):
+        """
+        Boolean masks routing glucose values to the low (<= 70), inner (70-130] and high (> 130) models
+        """
+        high = values > cls.HIGH_ABOVE
+        inner = (values > cls.INNER_ABOVE) & ~high
+        return {"low": ~(high | inner), "inner": inner, "high": high}
+
     def predict(self, x):
         """
         Predicts the action for a given set of observations.
-        x is a numpy array of shape (n_samples, n_features)
+        x is a numpy array of shape (n_samples, n_features), only the first feature (glucose) is used.
+        Each regime model runs once on all of its rows. No rows give an empty (0, 1) array.
         """
-        predictions = []
-        for obs in x:
-            value = obs[0]
-            # The model expects a 2D array of shape (1, 1)
-            obs_array = np.array([[value]])
-            if value > 130:
-                action, _ = self.high_model.predict(obs_array, deterministic=True)
-            elif 70 < value <= 130:
-                action, _ = self.inner_model.predict(obs_array, deterministic=True)
-            else:
-                action, _ = self.low_model.predict(obs_array, deterministic=True)
-            predictions.append(action[0])
-        return np.array(predictions)
+        if len(x) == 0:
+            return np.zeros((0, 1), dtype=np.float32)
+        values = np.asarray(x, dtype=np.float64).reshape(len(x), -1)[:, 0]
+        models = {"low": self.low_model, "inner": self.inner_model, "high": self.high_model}
+        predictions = None
+        for regime, mask in self.regime_masks(values).items():
+            if not mask.any():
+                continue
+            # The models expect a 2D array of shape (n, 1)
+            action, _ = models[regime].predict(values[mask].reshape(-1, 1), deterministic=True)
+            if predictions is None:
+                predictions = np.zeros((len(values),) + action.shape[1:], dtype=action.dtype)
+            predictions[mask] = action
+        return predictions
 
 class Explainer:
     def __init__(self, predictor, training_data, feature_names):
+        import lime.lime_tabular
+
         self.predictor = predictor
         self.explainer = lime.lime_tabular.LimeTabularExplainer(
             training_data,
@@ -0,0 +1,154 @@
+import time
+import numpy as np
+from datetime import timedelta
+from CoreLogic.patient_batch import PatientBatch, PARAM_NAMES
+from CoreLogic.rewards import risk_index
+from CoreLogic.dosing_rules import scale_dose, InjectionLimit
+
+# Model-predictive lookahead dosing: the regime policy's proposal and a set of candidate doses are
+# simulated forward as one PatientBatch (one row per candidate) and the dose with the lowest
+# predicted glycemic risk wins. Every simulated dose goes through the runners' dosing rules
+# (CoreLogic.dosing_rules), so a branch delivers what the runner would deliver. Pure NumPy, no
+# display or GPU, with a hard per-decision time budget.
+
+
+class LookaheadController:
+    """
+    Picks the dose with the lowest mean predicted risk over the next `horizon` minutes.
+    Each branch proposes its candidate at every decision step (`decision_minutes`); the dosing rules
+    scale it by the branch's predicted glucose and risk and drop it once the branch used up its hourly
+    injections, counted from the runner's recent injections on. Branches then run on without doses to
+    `safety_horizon`, long enough for the insulin given to act, and those whose glucose falls below
+    `min_glucose` on the way are rejected; when every branch does, the one staying highest wins.
+    Meals come from the scenario (announced meals). The budget is checked before every integration
+    step, each at most one decision step or, past the risk horizon, one stable RK4 step long; a rollout
+    cut short of safety_horizon keeps the policy's proposal, so the controller only overrides the
+    policy with a dose it checked.
+    """
+    def __init__(self, candidates=(0.0, 0.05, 0.1, 0.2, 0.3), horizon=90, budget=0.1, safety_horizon=240,
+                 decision_minutes=3, min_glucose=70, substeps=1):
+        self.candidates = tuple(candidates)
+        self.horizon = horizon
+        self.budget = budget
+        self.safety_horizon = max(safety_horizon, horizon)
+        self.decision_minutes = decision_minutes
+        self.min_glucose = min_glucose
+        self.substeps = substeps
+        self.last_decision = None
+        self._params = {}
+        self._pump_limits = {}
+
+    def _patient_params(self, patient):
+        """
+        Parameter scalars of a patient, cached by name so a decision does not touch pandas
+        """
+        params = self._params.get(patient.name)
+        if params is None:
+            params = {name: float(patient._params[name]) for name in PARAM_NAMES}
+            self._params[patient.name] = params
+        return params
+
+    def _branch(self, patient, n):
+        """
+        PatientBatch of n copies of the patient's current state and meal bookkeeping
+        """
+        params = self._patient_params(patient)
+        batch = PatientBatch({name: np.full(n, value) for name, value in params.items()},
+                             np.tile(patient.state, (n, 1)), substeps=self.substeps)
+        batch.last_qsto[:] = patient._last_Qsto
+        batch.last_foodtaken[:] = patient._last_foodtaken
+        batch.last_cho[:] = patient._last_action.CHO
+        batch.is_eating[:] = patient.is_eating
+        batch.planned_meal[:] = patient.planned_meal
+        return batch
+
+    def _pump_basal(self, pump, doses):
+        """
+        pump.basal (increments and limits) on an array of doses, with the pump parameters cached
+        """
+        limits = self._pump_limits.get(id(pump))
+        if limits is None or limits[0] is not pump:
+            params = pump._params
+            limits = (pump, float(params["inc_basal"]), float(params["min_basal"]), float(params["max_basal"]))
+            self._pump_limits[id(pump)] = limits
+        _, increment, low, high = limits
+        units = pump.U2PMOL
+        return np.clip(np.round(doses * units / increment) * increment / units, low, high)
+
+    def choose(self, patient, meals, proposal, observation=None, risk=0.0, injections=(), pump=None, start=None):
+        """
+        Returns the chosen dose for patient (a T1DPatient or NumpyT1DPatient), before the dosing rules,
+        which the runner applies to it as it did in the rollout.
+        meals holds the announced CHO (g) for each of the next `safety_horizon` minutes; with fewer
+        the proposal is kept. observation and risk are what the runner's rules see now (observation
+        defaults to the patient's glucose), injections the minutes (<= 0, relative to now) of its
+        doses in the past hour. Delivered doses go through pump.basal when a pump is given.
+        start is the perf_counter() time the budget counts from, now by default.
+        """
+        start = time.perf_counter() if start is None else start
+        deadline = start + self.budget
+        doses = np.array(list(dict.fromkeys([proposal] + list(self.candidates))), dtype=np.float64)
+        batch = self._branch(patient, len(doses))
+        limit = InjectionLimit(len(doses), injections)
+        meals = np.asarray(meals, dtype=np.float64)
+        end = min(self.safety_horizon, len(meals))
+        observation = batch.glucose if observation is None else np.full(len(doses), observation)
+        step_risk = np.full(len(doses), risk, dtype=np.float64)
+
+        risk_sum = np.zeros(len(doses))
+        lowest = np.full(len(doses), np.inf)
+        meal_minutes = np.flatnonzero(meals > 0)
+        # Whole minutes, so steps stay aligned with the per-minute meals
+        tail_step = max(1, int(batch.max_step))
+        delivered = None
+        minute = next_decision = 0
+        while minute < end and time.perf_counter() < deadline:
+            if minute < self.horizon:
+                if minute >= next_decision:
+                    insulin = limit.apply(scale_dose(doses, observation, step_risk), minute)
+                    if pump is not None:
+                        insulin = self._pump_basal(pump, insulin)
+                    delivered = insulin if delivered is None else delivered
+                    next_decision = minute + self.decision_minutes
+                stop = min(self.horizon, next_decision)
+            else:
+                # Past the risk horizon no more doses: the insulin given acts out
+                insulin = 0.0
+                stop = min(end, minute + tail_step)
+            if meals[minute] > 0 or batch.is_eating.any() or batch.planned_meal.any():
+                batch.step(meals[minute], insulin)
+                span = 1
+            else:
+                upcoming = meal_minutes[meal_minutes > minute]
+                span = min(stop, upcoming[0] if len(upcoming) else stop) - minute
+                batch.advance(span, insulin)
+            observation = batch.glucose
+            step_risk = risk_index(observation)[2]
+            if minute < self.horizon:
+                risk_sum += step_risk * span
+            lowest = np.minimum(lowest, observation)
+            minute += span
+
+        if minute < self.safety_horizon:
+            best = 0
+        else:
+            safe = lowest >= self.min_glucose
+            best = int(np.argmin(np.where(safe, risk_sum, np.inf))) if safe.any() else int(np.argmax(lowest))
+        self.last_decision = {"doses": doses, "delivered": delivered,
+                              "mean_risk": risk_sum / max(min(minute, self.horizon), 1), "lowest": lowest,
+                              "horizon": minute, "seconds": time.perf_counter() - start}
+        return float(doses[best])
+
+    def choose_for_env(self, env, proposal, observation=None, risk=0.0, injections=()):
+        """
+        choose() for a ReusableT1DSimEnv (env.unwrapped), reading the patient, pump and upcoming meals
+        from it. The meal lookup counts towards the budget.
+        """
+        start = time.perf_counter()
+        sim = env.env.env
+        now = sim.time
+        meals = []
+        # The scan stops at the deadline too, and choose() then keeps to the minutes it covers
+        while len(meals) < self.safety_horizon and time.perf_counter() - start < self.budget:
+            meals.append(sim.scenario.get_action(now + timedelta(minutes=len(meals))).meal)
+        return self.choose(sim.patient, meals, proposal, observation, risk, injections, pump=sim.pump, start=start)
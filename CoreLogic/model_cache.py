@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# LRU cache for loaded model sets in a serving process. Loads are single-flight (concurrent
+# requests for a set that is loading wait for that one load), entries are evicted least recently
+# used first once their estimated memory exceeds the budget, and counters are kept for a stats
+# endpoint. Every WSGI worker process has its own cache; the state is reset in forked children.
+
+
+def model_nbytes(model):
+    """
+    Estimated resident bytes of one regime model: NumPy policy or dose table arrays, or an SB3 model's
+    torch parameters and buffers, doubled again for the Adam state SB3 restores with them
+    """
+    if hasattr(model, "weights"):
+        return sum(w.nbytes for w in model.weights) + sum(b.nbytes for b in model.biases)
+    if hasattr(model, "glucose"):
+        return model.glucose.nbytes + model.dose.nbytes
+    policy = getattr(model, "policy", None)
+    if policy is None:
+        return 0
+    tensors = list(policy.parameters())
+    parameters = sum(t.numel() * t.element_size() for t in tensors)
+    buffers = sum(t.numel() * t.element_size() for t in policy.buffers())
+    return 3 * parameters + buffers
+
+
+def predictor_nbytes(predictor):
+    return sum(model_nbytes(m) for m in (predictor.low_model, predictor.inner_model, predictor.high_model))
+
+
+class ModelCache:
+    """
+    get(key, loader) returns the cached value or calls loader() once, however many threads ask.
+    max_bytes bounds the summed sizeof() of the entries; the newest entry is always kept, even alone
+    over the budget.
+    """
+    def __init__(self, max_bytes, sizeof=predictor_nbytes):
+        self.max_bytes = int(max_bytes)
+        self.sizeof = sizeof
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            # A forked worker inherits neither the loading threads nor a usable lock
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, nbytes), least recently used first
+        self._loading = {}  # key -> Future of the load in flight
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # requests that waited for a load already in flight
+        self.evictions = 0
+        self.failures = 0
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._loading[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+            nbytes = self.sizeof(value)
+        except BaseException as e:
+            with self._lock:
+                self.failures += 1
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._entries[key] = (value, nbytes)
+            self.bytes += nbytes
+            self._evict()
+            del self._loading[key]
+        future.set_result(value)
+        return value
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.bytes -= nbytes
+            self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": list(self._entries),
+                "loading": list(self._loading),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "failures": self.failures,
+                "pid": os.getpid(),
+            }
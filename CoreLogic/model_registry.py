@@ -0,0 +1,211 @@
+import os
+import re
+import sys
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime
+
+# Index of model sets, so listing, lookup and "latest set for a patient" read one JSON file instead of
+# globbing and stat-ing every directory. Each set directory carries a manifest.json (algorithm, patient,
+# timesteps, metrics, artifacts with their sha256); the root keeps registry.json with every manifest,
+# the latest set per patient and the first copy of every artifact hash. Identical artifacts point at that
+# first copy ("blob") and a set whose artifacts all match an earlier set records it as duplicate_of, so
+# loaders can share one copy. Files are never rewritten: SB3 saves truncate in place, links would leak.
+
+INDEX_NAME = "registry.json"
+MANIFEST_NAME = "manifest.json"
+MODEL_NAMES = ("lowmodel", "innermodel", "highmodel")
+ALGORITHMS = ("A2C", "PPO", "TD3")
+_PATIENT_PATTERN = re.compile(r"(adolescent|adult|child)#\d{3}")
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_metrics(path):
+    """
+    Parses a DataSaver metrics.txt ("name: value" lines), {} when there is none
+    """
+    metrics = {}
+    if not Path(path).exists():
+        return metrics
+    for line in Path(path).read_text().splitlines():
+        name, _, value = line.rpartition(":")
+        try:
+            metrics[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return metrics
+
+
+def _write_json(path, data):
+    """
+    Writes through a temporary file and os.replace, so readers never see half an index
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(data, indent=2))
+    os.replace(tmp_path, path)
+
+
+def _guess_from_name(name):
+    """
+    (algorithm, patient) from a directory name like PPO_child#002_12 or child#002_PPO_00, None when absent
+    """
+    algorithm = next((a for a in ALGORITHMS if a in name.split("_")), None)
+    patient = _PATIENT_PATTERN.search(name)
+    return algorithm, patient.group(0) if patient else None
+
+
+class ModelRegistry:
+    """
+    registry.json under root, loaded once. Every query is a dict lookup or a read of the cached index.
+    Sets copied into root by hand are picked up by sync() (python -m CoreLogic.model_registry <root>);
+    a missing index is built by one scan on first use.
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+        self.index_path = self.root / INDEX_NAME
+        if self.index_path.exists():
+            self.index = json.loads(self.index_path.read_text())
+        else:
+            self.index = {"sets": {}, "latest": {}, "blobs": {}}
+            if self.root.is_dir():
+                self.sync()
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        _write_json(self.index_path, self.index)
+
+    def register(self, set_dir, algorithm=None, patient=None, timesteps=None, metrics=None, save=True):
+        """
+        Hashes the set's artifacts, writes its manifest.json and adds it to the index.
+        Returns the manifest.
+        """
+        set_dir = Path(set_dir)
+        guessed_algorithm, guessed_patient = _guess_from_name(set_dir.name)
+        manifest_path = set_dir / MANIFEST_NAME
+        # Metadata not given here is kept from the index, or from a manifest the set was copied with
+        previous = self.index["sets"].get(set_dir.name) or \
+            (json.loads(manifest_path.read_text()) if manifest_path.exists() else {})
+        self._drop_blobs(set_dir.name)
+
+        artifacts = {}
+        for path in sorted(set_dir.iterdir()):
+            if path.suffix not in (".zip", ".npz") or not path.is_file():
+                continue
+            digest = file_sha256(path)
+            blob = self.index["blobs"].setdefault(digest, os.path.relpath(path, self.root))
+            artifacts[path.name] = {"sha256": digest, "size": path.stat().st_size, "blob": blob}
+
+        manifest = {
+            "name": set_dir.name,
+            "path": os.path.relpath(set_dir, self.root),
+            "algorithm": algorithm or previous.get("algorithm") or guessed_algorithm,
+            "patient": patient or previous.get("patient") or guessed_patient,
+            "timesteps": timesteps if timesteps is not None else previous.get("timesteps"),
+            "created": previous.get("created") or datetime.fromtimestamp(set_dir.stat().st_mtime).isoformat(),
+            "metrics": metrics if metrics is not None else read_metrics(set_dir / "metrics.txt"),
+            "artifacts": artifacts,
+            "complete": all(f"{name}.zip" in artifacts for name in MODEL_NAMES),
+            "duplicate_of": self._duplicate_of(set_dir.name, artifacts),
+        }
+        _write_json(manifest_path, manifest)
+
+        self.index["sets"][set_dir.name] = manifest
+        self._update_latest(manifest)
+        if save:
+            self.save()
+        return manifest
+
+    def _duplicate_of(self, name, artifacts):
+        """
+        Name of the set whose artifacts are the first copies of all of these, None when some are new
+        """
+        owners = {Path(info["blob"]).parent.name for info in artifacts.values()}
+        if len(owners) == 1 and name not in owners:
+            return owners.pop()
+        return None
+
+    def _drop_blobs(self, name):
+        for digest, artifact in list(self.index["blobs"].items()):
+            if Path(artifact).parent.name == name:
+                del self.index["blobs"][digest]
+
+    def _update_latest(self, manifest):
+        patient = manifest["patient"]
+        if not patient or not manifest["complete"]:
+            return
+        current = self.index["sets"].get(self.index["latest"].get(patient))
+        if current is None or current["created"] <= manifest["created"]:
+            self.index["latest"][patient] = manifest["name"]
+
+    def unregister(self, name, save=True):
+        manifest = self.index["sets"].pop(name, None)
+        if manifest is None:
+            return
+        self._drop_blobs(name)
+        # Artifacts whose first copy was in this set move on to the next copy
+        for other in self.index["sets"].values():
+            for artifact, info in other["artifacts"].items():
+                info["blob"] = self.index["blobs"].setdefault(info["sha256"], str(Path(other["path"]) / artifact))
+            other["duplicate_of"] = self._duplicate_of(other["name"], other["artifacts"])
+        if self.index["latest"].get(manifest["patient"]) == name:
+            del self.index["latest"][manifest["patient"]]
+            for other in self.index["sets"].values():
+                self._update_latest(other)
+        if save:
+            self.save()
+
+    def sync(self):
+        """
+        One scan of root: registers new set directories (keeping the metadata of their manifest.json)
+        and drops index entries whose directory is gone
+        """
+        present = {p.name: p for p in self.root.iterdir() if p.is_dir()} if self.root.is_dir() else {}
+        for name in list(self.index["sets"]):
+            if name not in present:
+                self.unregister(name, save=False)
+        for name, set_dir in sorted(present.items()):
+            if name not in self.index["sets"] and any(set_dir.glob("*.zip")):
+                self.register(set_dir, save=False)
+        self.save()
+
+    def get(self, name):
+        return self.index["sets"].get(name)
+
+    def path(self, name):
+        return self.root / self.index["sets"][name]["path"]
+
+    def latest(self, patient):
+        """
+        Path of the most recent complete set trained for patient, None when there is none
+        """
+        name = self.index["latest"].get(patient)
+        return self.path(name) if name else None
+
+    def list(self, patient=None, algorithm=None, complete=True):
+        """
+        Manifests, most recent first, optionally filtered by patient and algorithm
+        """
+        manifests = [m for m in self.index["sets"].values()
+                     if (not complete or m["complete"])
+                     and (patient is None or m["patient"] == patient)
+                     and (algorithm is None or m["algorithm"] == algorithm)]
+        return sorted(manifests, key=lambda m: m["created"], reverse=True)
+
+    def names(self, **filters):
+        return [m["name"] for m in self.list(**filters)]
+
+
+if __name__ == "__main__":
+    # Usage: python -m CoreLogic.model_registry [root, default TrainingModels]
+    registry = ModelRegistry(sys.argv[1] if len(sys.argv) > 1 else "TrainingModels")
+    registry.sync()
+    for m in registry.list(complete=False):
+        print(f"{m['name']:<32} {m['algorithm'] or '-':<4} {m['patient'] or '-':<14} {m['created']}")
@@ -0,0 +1,142 @@
+import sys
+import numpy as np
+from pathlib import Path
+
+# Only this module's export side needs torch/stable-baselines3. Loading and evaluating
+# an exported artifact is pure NumPy.
+
+MODEL_NAMES = ("lowmodel", "innermodel", "highmodel")
+ARTIFACT_NAME = "policies.npz"
+
+_ACTIVATIONS = {
+    "Identity": lambda x: x,
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0),
+    "LeakyReLU": lambda x: np.where(x > 0, x, 0.01 * x),
+    "ELU": lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+    "Sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+}
+
+
+class NumpyPolicy:
+    """
+    Deterministic forward pass of an exported stable-baselines3 MlpPolicy actor.
+    predict() mirrors BaseAlgorithm.predict so it can stand in for the SB3 model
+    in SimulationRunner, Predictor and the Flask app.
+    """
+    def __init__(self, weights, biases, activations, low, high, squash_output):
+        self.weights = weights
+        self.biases = biases
+        self.activations = activations
+        self.low = low
+        self.high = high
+        self.squash_output = squash_output
+        self.obs_dim = weights[0].shape[0]
+
+    def forward(self, obs):
+        x = obs
+        for w, b, activation in zip(self.weights, self.biases, self.activations):
+            x = _ACTIVATIONS[activation](x @ w + b)
+        if self.squash_output:
+            # TD3 actors output [-1, 1], rescaled to the action space
+            return self.low + 0.5 * (x + 1.0) * (self.high - self.low)
+        return np.clip(x, self.low, self.high)
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        obs = np.asarray(observation, dtype=np.float32)
+        vectorized = obs.ndim > 1
+        actions = self.forward(obs.reshape(-1, self.obs_dim))
+        if not vectorized:
+            actions = actions[0]
+        return actions, state
+
+
+def _actor_layers(model):
+    """
+    Returns the Sequential modules that map features to actions for PPO/A2C or TD3 policies
+    """
+    policy = model.policy
+    if hasattr(policy, "actor") and hasattr(policy.actor, "mu"):
+        return [policy.actor.mu], True
+    if getattr(policy, "use_sde", False):
+        raise ValueError("State-dependent exploration policies are not supported for export")
+    return [policy.mlp_extractor.policy_net, policy.action_net], False
+
+
+def export_policy(model, prefix):
+    """
+    Flattens one SB3 model's actor into arrays keyed by prefix, ready for np.savez
+    """
+    import torch
+
+    layers, squash_output = _actor_layers(model)
+    arrays = {}
+    activations = []
+    n_linear = 0
+    for module in layers:
+        modules = module if isinstance(module, torch.nn.Sequential) else [module]
+        for layer in modules:
+            if isinstance(layer, torch.nn.Linear):
+                if n_linear > len(activations):
+                    activations.append("Identity")
+                arrays[f"{prefix}.w{n_linear}"] = layer.weight.detach().cpu().numpy().T.astype(np.float32)
+                arrays[f"{prefix}.b{n_linear}"] = layer.bias.detach().cpu().numpy().astype(np.float32)
+                n_linear += 1
+            elif type(layer).__name__ in _ACTIVATIONS:
+                activations.append(type(layer).__name__)
+            else:
+                raise ValueError(f"Unsupported layer in policy network: {layer}")
+    if n_linear > len(activations):
+        activations.append("Identity")
+
+    arrays[f"{prefix}.activations"] = np.array(activations)
+    arrays[f"{prefix}.low"] = model.action_space.low.astype(np.float32)
+    arrays[f"{prefix}.high"] = model.action_space.high.astype(np.float32)
+    arrays[f"{prefix}.squash_output"] = np.array(squash_output)
+    return arrays
+
+
+def export_model_set(models, base_dir: Path, filename=ARTIFACT_NAME):
+    """
+    Writes the low/inner/high actors into a single compressed .npz next to the .zip models.
+    models maps "lowmodel"/"innermodel"/"highmodel" to loaded SB3 models.
+    """
+    arrays = {}
+    for name in MODEL_NAMES:
+        arrays.update(export_policy(models[name], name))
+    path = Path(base_dir) / filename
+    np.savez_compressed(path, **arrays)
+    print(f"[Model I/O] Exported NumPy policies to {path}")
+    return path
+
+
+def load_policy(data, prefix):
+    activations = [str(a) for a in data[f"{prefix}.activations"]]
+    weights = [data[f"{prefix}.w{i}"] for i in range(len(activations))]
+    biases = [data[f"{prefix}.b{i}"] for i in range(len(activations))]
+    return NumpyPolicy(weights, biases, activations,
+                       data[f"{prefix}.low"], data[f"{prefix}.high"],
+                       bool(data[f"{prefix}.squash_output"]))
+
+
+def has_numpy_policies(base_dir: Path, filename=ARTIFACT_NAME):
+    return (Path(base_dir) / filename).exists()
+
+
+def load_numpy_policies(base_dir: Path, filename=ARTIFACT_NAME):
+    """
+    Returns the (lowmodel, innermodel, highmodel) NumpyPolicy triple of a model set
+    """
+    with np.load(Path(base_dir) / filename) as data:
+        return tuple(load_policy(data, name) for name in MODEL_NAMES)
+
+
+if __name__ == "__main__":
+    # Usage: python -m CoreLogic.numpy_policy <model set directory> [A2C|PPO|TD3]
+    from CoreLogic.simulation_core import load_model_from_file, get_model_path
+
+    model_dir = Path(sys.argv[1])
+    model_type = sys.argv[2] if len(sys.argv) > 2 else "PPO"
+    loaded = {name: load_model_from_file(get_model_path(model_dir, name), model_type, env=None)
+              for name in MODEL_NAMES}
+    export_model_set(loaded, model_dir)
@@ -0,0 +1,205 @@
+import numpy as np
+
+# Declarative reward specifications for the glucose environments. A RewardSpec is built from
+# range bands, dose terms, a variability penalty and night-time bands, and compile() turns it
+# into one NumPy function that scores a single step or whole batches of steps at once.
+
+_CLOSED = ("left", "right", "both", "neither")
+
+
+class Band:
+    """
+    Glucose interval [low, high) (see closed) that adds value + scale * |bg - ref| ** power while bg is in it.
+    Bands of one spec are meant to be disjoint, like the branches of an if/elif chain.
+    """
+    def __init__(self, low=-np.inf, high=np.inf, value=0.0, scale=0.0, ref=0.0, power=1.0, closed="left"):
+        if closed not in _CLOSED:
+            raise ValueError(f"closed must be one of {_CLOSED}, got {closed!r}")
+        self.low = low
+        self.high = high
+        self.value = value
+        self.scale = scale
+        self.ref = ref
+        self.power = power
+        self.closed = closed
+
+
+class DoseTerm:
+    """
+    Adds value + per_unit * action on steps where every given condition holds:
+    action > action_above, action == 0 (inaction), bg < bg_below, bg > bg_above.
+    """
+    def __init__(self, value=0.0, per_unit=0.0, action_above=None, inaction=False, bg_below=None, bg_above=None):
+        self.value = value
+        self.per_unit = per_unit
+        self.action_above = action_above
+        self.inaction = inaction
+        self.bg_below = bg_below
+        self.bg_above = bg_above
+
+
+class VariabilityPenalty:
+    """
+    Subtracts scale * |bg - previous bg|, skipped on the first step of an episode (previous bg NaN)
+    """
+    def __init__(self, scale=0.05):
+        self.scale = scale
+
+
+class NightBands:
+    """
+    Extra bands that only apply while start_hour <= hour < end_hour
+    """
+    def __init__(self, bands, start_hour=0, end_hour=6):
+        self.bands = list(bands)
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+
+
+class RewardSpec:
+    """
+    reward = base + bands + dose terms + variability + night bands.
+    base is a constant, or "env" to start from the simulator's own reward (simglucose's risk difference).
+    """
+    def __init__(self, base=0.0, bands=(), doses=(), variability=None, night=None):
+        self.base = base
+        self.bands = list(bands)
+        self.doses = list(doses)
+        self.variability = variability
+        self.night = night
+
+    def compile(self):
+        return compile_reward(self)
+
+
+def _band_arrays(bands):
+    """
+    Stacks band parameters into (n_bands, 1) columns so all bands are evaluated in one broadcast
+    """
+    columns = {name: np.array([getattr(b, name) for b in bands], dtype=np.float64)[:, None]
+               for name in ("low", "high", "value", "scale", "ref", "power")}
+    columns["left_closed"] = np.array([b.closed in ("left", "both") for b in bands])[:, None]
+    columns["right_closed"] = np.array([b.closed in ("right", "both") for b in bands])[:, None]
+    return columns
+
+
+def _evaluate_bands(c, bg):
+    above_low = np.where(c["left_closed"], bg >= c["low"], bg > c["low"])
+    below_high = np.where(c["right_closed"], bg <= c["high"], bg < c["high"])
+    shaped = c["value"] + c["scale"] * np.abs(bg - c["ref"]) ** c["power"]
+    return np.where(above_low & below_high, shaped, 0.0).sum(axis=0)
+
+
+def risk_index(bg):
+    """
+    simglucose's risk_index for single readings, vectorized: (LBGI, HBGI, risk) arrays.
+    Readings below 1 mg/dL are scored as 1 so the logarithm stays defined.
+    """
+    f_bg = 1.509 * (np.log(np.maximum(np.asarray(bg, dtype=np.float64), 1.0)) ** 1.084 - 5.381)
+    risk = 10 * f_bg ** 2
+    lbgi = np.where(f_bg < 0, risk, 0.0)
+    hbgi = np.where(f_bg > 0, risk, 0.0)
+    return lbgi, hbgi, lbgi + hbgi
+
+
+def compile_reward(spec: RewardSpec):
+    """
+    Returns reward(bg, action, prev_bg=None, hour=None, env_reward=None) for spec.
+    Every argument is a scalar or an array of the same length; the result has bg's shape.
+    prev_bg is NaN (or None) where there is no previous reading; hour is needed only for night bands
+    and env_reward only for base="env".
+    """
+    bands = _band_arrays(spec.bands) if spec.bands else None
+    night = _band_arrays(spec.night.bands) if spec.night is not None and spec.night.bands else None
+    doses = list(spec.doses)
+    variability = spec.variability
+    from_env = isinstance(spec.base, str)
+    if from_env and spec.base != "env":
+        raise ValueError(f"base must be a number or 'env', got {spec.base!r}")
+
+    def reward(bg, action, prev_bg=None, hour=None, env_reward=None):
+        bg = np.asarray(bg, dtype=np.float64)
+        flat = bg.reshape(1, -1)
+        action = np.asarray(action, dtype=np.float64).reshape(-1)
+        total = np.array(env_reward, dtype=np.float64).reshape(-1) if from_env else np.full(flat.shape[1], spec.base)
+
+        if night is not None:
+            hour = np.asarray(hour).reshape(-1)
+            at_night = (hour >= spec.night.start_hour) & (hour < spec.night.end_hour)
+            total = total + np.where(at_night, _evaluate_bands(night, flat), 0.0)
+        if bands is not None:
+            total = total + _evaluate_bands(bands, flat)
+        for dose in doses:
+            applies = np.ones(flat.shape[1], dtype=bool)
+            if dose.action_above is not None:
+                applies &= action > dose.action_above
+            if dose.inaction:
+                applies &= action == 0
+            if dose.bg_below is not None:
+                applies &= flat[0] < dose.bg_below
+            if dose.bg_above is not None:
+                applies &= flat[0] > dose.bg_above
+            total = total + np.where(applies, dose.value + dose.per_unit * action, 0.0)
+        if variability is not None and prev_bg is not None:
+            prev_bg = np.asarray(prev_bg, dtype=np.float64).reshape(-1)
+            fluctuation = np.abs(flat[0] - prev_bg)
+            total = total - np.where(np.isnan(fluctuation), 0.0, variability.scale * fluctuation)
+        return total.reshape(bg.shape)
+
+    return reward
+
+
+# === Specifications of the custom environments ===
+
+# CustomT1DSimGymnaisumEnv: simglucose's reward, +0.5 within 100-140, -0.05/mg/dL from 120 outside,
+# stricter between 00:00 and 06:00
+CUSTOM_REWARD = RewardSpec(
+    base="env",
+    bands=[
+        Band(high=100, scale=-0.05, ref=120),
+        Band(100, 140, value=0.5, closed="both"),
+        Band(low=140, scale=-0.05, ref=120, closed="right"),
+    ],
+    variability=VariabilityPenalty(0.05),
+    night=NightBands([
+        Band(100, 150, value=0.7, closed="both"),
+        Band(low=160, value=-1.5, closed="right"),
+    ]),
+)
+
+# LowGlucoseEnv: avoid hypoglycemia at all costs, never dose when low
+LOW_GLUCOSE_REWARD = RewardSpec(
+    base=-0.01,
+    bands=[
+        Band(high=70, value=-1.0, scale=-0.1, ref=70, power=1.5),
+        Band(70, 80, value=-0.5),
+        Band(80, 180, value=0.1, closed="both"),
+        Band(low=180, scale=-1 / 200.0, ref=180, closed="right"),
+    ],
+    doses=[DoseTerm(per_unit=-2.0, action_above=0, bg_below=100)],
+    variability=VariabilityPenalty(0.05),
+)
+
+# HighGlucoseEnv: bring high glucose down, penalize inaction above 160
+HIGH_GLUCOSE_REWARD = RewardSpec(
+    base=-0.01,
+    bands=[
+        Band(high=70, value=-1.5),
+        Band(70, 180, value=0.1, closed="both"),
+        Band(low=180, value=-0.5, scale=-0.01, ref=180, closed="right"),
+    ],
+    doses=[DoseTerm(value=-2.0, inaction=True, bg_above=160)],
+    variability=VariabilityPenalty(0.05),
+)
+
+# InnerGlucoseEnv: tight control around 100 within 70-130, discourage large doses
+INNER_GLUCOSE_REWARD = RewardSpec(
+    base=-0.01,
+    bands=[
+        Band(high=70, value=-1.5, scale=-0.1, ref=70),
+        Band(70, 130, value=0.2, scale=-0.0005, ref=100, power=2, closed="both"),
+        Band(low=130, value=-0.5, scale=-0.01, ref=130, closed="right"),
+    ],
+    doses=[DoseTerm(per_unit=-0.2, action_above=0.5)],
+    variability=VariabilityPenalty(0.05),
+)
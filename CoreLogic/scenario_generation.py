@@ -0,0 +1,146 @@
+import json
+import numpy as np
+from pathlib import Path
+
+# Meal profiles: one entry per meal slot. Times are minutes from midnight, durations minutes,
+# amounts grams of CHO per kg body weight.
+
+# A child's typical day: Breakfast, Morning Snack, Lunch, Afternoon Snack, Dinner (generated_day)
+CHILD_MEAL_PROFILE = {
+    "probability": [0.98, 0.95, 0.98, 0.95, 0.98],
+    "meantime": [t * 60 for t in [7.5, 10.5, 12.5, 16, 18.5]],
+    "variancetime": [30, 15, 30, 30, 45],
+    "lowerbound": [(t * 60) - 60 for t in [7, 10, 12, 15.5, 18]],
+    "upperbound": [(t * 60) + 60 for t in [8, 11, 13.5, 16.5, 19.5]],
+    "meanmealtime": [20, 10, 25, 15, 30],
+    "variancemealtime": [5, 3, 5, 5, 5],
+    "loverboundmealtime": [10, 5, 15, 10, 20],
+    "upperboundmealtime": [30, 15, 35, 20, 40],
+    "meanamount": [1.0, 0.4, 1.2, 0.5, 1.1],
+    "varianceamount": [g * 0.2 for g in [1.0, 0.4, 1.2, 0.5, 1.1]],
+}
+
+# Three meals and three snacks (generaltnap in ModelAndEnviromentHelper)
+DAILY_MEAL_PROFILE = {
+    "probability": [0.95, 0.3, 0.95, 0.3, 0.95, 0.3],
+    "meantime": [i * 60 for i in [7, 9.5, 12, 15, 18, 21.5]],
+    "variancetime": [60, 30, 60, 30, 60, 30],
+    "lowerbound": [i * 60 for i in [5, 9, 10, 14, 16, 20]],
+    "upperbound": [i * 60 for i in [9, 10, 14, 16, 20, 23]],
+    # generaltnap's list had a stray 0.5 (and a seventh entry); these are the values it actually used
+    "meanmealtime": [20, 7.5, 20, 7, 0.5, 20],
+    "variancemealtime": [5, 2, 5, 2, 5, 2],
+    "loverboundmealtime": [10, 5, 10, 5, 10, 5],
+    "upperboundmealtime": [30, 10, 30, 10, 30, 10],
+    "meanamount": [0.7, 0.15, 1.1, 0.15, 1.25, 0.15],
+    "varianceamount": [i * 0.15 for i in [0.7, 0.15, 1.1, 0.15, 1.25, 0.15]],
+}
+
+
+def _truncnorm(rng, mean, std, lower, upper, size):
+    """
+    Truncated normal samples by inverting the CDF, vectorized over the meal slots
+    """
+    from scipy.special import ndtr, ndtri
+
+    cdf_low = ndtr((lower - mean) / std)
+    cdf_high = ndtr((upper - mean) / std)
+    u = rng.uniform(cdf_low, cdf_high, size=size)
+    # Clip guards the far tails where the CDF saturates in floating point
+    return np.clip(mean + std * ndtri(u), lower, upper)
+
+
+def generate_meal_days(bw, n_days, profile=CHILD_MEAL_PROFILE, seed=None, rng=None, rounded=True):
+    """
+    Draws n_days of meal events in one vectorized call.
+
+    Args:
+        bw: Body weight in kg, amounts scale with it. Pass 1 to get grams per kg.
+        n_days: Number of days to generate.
+        profile: Meal profile dict (CHILD_MEAL_PROFILE, DAILY_MEAL_PROFILE or a custom one).
+        seed: Seed for a new numpy.random.Generator, ignored when rng is given.
+        rng: An existing numpy.random.Generator.
+        rounded: Round to whole grams/minutes like generated_day, False keeps the raw draws.
+
+    Returns:
+        Dict of (n_days, n_meals) arrays: "present" (bool), "amount" (g), "time" (min), "duration" (min).
+    """
+    rng = rng if rng is not None else np.random.default_rng(seed)
+    p = {k: np.asarray(v, dtype=np.float64) for k, v in profile.items()}
+    size = (n_days, len(p["probability"]))
+
+    present = rng.random(size) < p["probability"]
+    amount = np.maximum(0, rng.normal(p["meanamount"] * bw, p["varianceamount"] * bw, size=size))
+    time = _truncnorm(rng, p["meantime"], p["variancetime"], p["lowerbound"], p["upperbound"], size)
+    duration = _truncnorm(rng, p["meanmealtime"], p["variancemealtime"],
+                          p["loverboundmealtime"], p["upperboundmealtime"], size)
+    if not rounded:
+        return {"present": present, "amount": amount, "time": time, "duration": duration}
+    return {
+        "present": present,
+        "amount": np.rint(amount).astype(np.int64),
+        "time": np.rint(time).astype(np.int64),
+        "duration": np.rint(duration).astype(np.int64),
+    }
+
+
+def meal_events(days, index):
+    """
+    Returns day `index` of generate_meal_days output as [[amount, time, duration], ...] like generated_day
+    """
+    present = days["present"][index]
+    return np.stack([days["amount"][index][present], days["time"][index][present],
+                     days["duration"][index][present]], axis=1).tolist()
+
+
+class ScenarioBank:
+    """
+    Pregenerated meal days in a memory-mapped .npy file, read by integer index.
+    Amounts are stored per kg of body weight so one bank serves every patient, and runs that use the
+    same indices see identical meals (common random numbers across model sets, trials and runners).
+    Layout: float32 (n_days, n_meals, 4) with present flag, CHO g/kg, minute of day and duration.
+    """
+    FIELDS = ("present", "amount", "time", "duration")
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.days = np.load(self.path, mmap_mode="r")
+        meta_path = self.path.with_suffix(".json")
+        self.meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+
+    @classmethod
+    def create(cls, path, n_days, profile=CHILD_MEAL_PROFILE, seed=0, chunk_size=100_000):
+        """
+        Writes n_days to path in chunks, so banks larger than memory can be generated
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        n_meals = len(profile["probability"])
+        rng = np.random.default_rng(seed)
+
+        bank = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n_days, n_meals, 4))
+        for start in range(0, n_days, chunk_size):
+            stop = min(start + chunk_size, n_days)
+            days = generate_meal_days(1, stop - start, profile=profile, rng=rng, rounded=False)
+            bank[start:stop] = np.stack([days[name] for name in cls.FIELDS], axis=-1)
+        bank.flush()
+        del bank
+
+        path.with_suffix(".json").write_text(json.dumps({"n_days": n_days, "seed": seed, "profile": profile}))
+        print(f"Scenario bank with {n_days} days written to {path}")
+        return cls(path)
+
+    def __len__(self):
+        return len(self.days)
+
+    def meal_events(self, index, bw):
+        """
+        Day `index` scaled to body weight bw, as [[amount, time, duration], ...] like generated_day.
+        Raises IndexError past the end of the bank: wrapping around would reuse days as if they were new.
+        """
+        if not 0 <= index < len(self.days):
+            raise IndexError(f"Day {index} is outside the scenario bank {self.path} ({len(self.days)} days)")
+        day = self.days[index]
+        day = day[day[:, 0] > 0]
+        return [[int(round(amount * bw)), int(round(time)), int(round(duration))]
+                for _, amount, time, duration in day.tolist()]
@@ -1,20 +1,24 @@
 import numpy as np
 import pandas as pd
 import os
-import imageio
-import gymnasium
-import pkg_resources
+import queue
+import threading
+import functools
+import importlib.util
+import multiprocessing
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from PIL import ImageGrab
-import random
 from colorama import Fore
-from simglucose.simulation.scenario import CustomScenario
-from gymnasium.envs.registration import register
-from stable_baselines3 import A2C, TD3, PPO
-from stable_baselines3.common.noise import NormalActionNoise
-from stable_baselines3.common.callbacks import BaseCallback
+from CoreLogic.dosing_rules import scale_dose, InjectionLimit, MAX_INJECTIONS_PER_HOUR
+from CoreLogic.lime_explainer import Predictor
+from CoreLogic.rewards import risk_index
+from CoreLogic.scenario_generation import generate_meal_days, meal_events, CHILD_MEAL_PROFILE, ScenarioBank
+
+# Heavy dependencies (stable-baselines3/torch, gymnasium, simglucose, matplotlib, imageio, PIL) are
+# imported where they are used, so entry points that only need part of this module start quickly.
+# Run python -m CoreLogic.import_budget to check the import times.
 
 
 TIMESTEPS = 300
@@ -22,69 +26,66 @@ PATIENT_NAME = "child#002"
 
 # === Utility ===
 
-def generated_day(bw):
-    from scipy import stats
-    # Adjusted for a child's typical day: Breakfast, Morning Snack, Lunch, Afternoon Snack, Dinner
-    meal = {
-        "probability": [0.98, 0.95, 0.98, 0.95, 0.98],  # High probability for main meals and snacks
-        # Meal times in minutes from midnight
-        "meantime": [t * 60 for t in [7.5, 10.5, 12.5, 16, 18.5]],  # Breakfast, Snack, Lunch, Snack, Dinner
-        "variancetime": [30, 15, 30, 30, 45],
-        "lowerbound": [(t * 60) - 60 for t in [7, 10, 12, 15.5, 18]],
-        "upperbound": [(t * 60) + 60 for t in [8, 11, 13.5, 16.5, 19.5]],
-        # Meal duration in minutes
-        "meanmealtime": [20, 10, 25, 15, 30],
-        "variancemealtime": [5, 3, 5, 5, 5],
-        "loverboundmealtime": [10, 5, 15, 10, 20],
-        "upperboundmealtime": [30, 15, 35, 20, 40],
-        # CHO amount in grams, scaled by body weight (bw)
-        "meanamount": [g * bw for g in [1.0, 0.4, 1.2, 0.5, 1.1]], # Adjusted CHO for child
-        "varianceamount": [g * bw * 0.2 for g in [1.0, 0.4, 1.2, 0.5, 1.1]],
-        "E": []
-    }
-    for i in range(5): # Iterate through 5 meal events
-        if random.random() < meal["probability"][i]:
-            e = max(0, stats.norm(loc=meal["meanamount"][i], scale=meal["varianceamount"][i]).rvs())
-            t = stats.truncnorm(
-                (meal["lowerbound"][i] - meal["meantime"][i]) / meal["variancetime"][i],
-                (meal["upperbound"][i] - meal["meantime"][i]) / meal["variancetime"][i],
-                loc=meal["meantime"][i], scale=meal["variancetime"][i]).rvs()
-            h = stats.truncnorm(
-                (meal["loverboundmealtime"][i] - meal["meanmealtime"][i]) / meal["variancemealtime"][i],
-                (meal["upperboundmealtime"][i] - meal["meanmealtime"][i]) / meal["variancemealtime"][i],
-                loc=meal["meanmealtime"][i], scale=meal["variancemealtime"][i]).rvs()
-            meal["E"].append([int(round(e)), int(round(t)), int(round(h))])
-    return meal["E"]
+def generated_day(bw, rng=None):
+    """
+    One child's day of meals as [[CHO g, minute of day, duration min], ...].
+    See scenario_generation.generate_meal_days to draw many days at once.
+    """
+    days = generate_meal_days(bw, 1, profile=CHILD_MEAL_PROFILE, rng=rng)
+    return meal_events(days, 0)
+
+
+def simglucose_params_file(filename):
+    """
+    Path of a file in simglucose/params, found without importing simglucose (its __init__ imports gym)
+    """
+    spec = importlib.util.find_spec("simglucose")
+    return Path(spec.submodule_search_locations[0]) / "params" / filename
+
+
+@functools.lru_cache(maxsize=None)
+def patient_params_table():
+    """
+    vpatient_params.csv indexed by patient name, read once per process
+    """
+    return pd.read_csv(simglucose_params_file("vpatient_params.csv")).set_index("Name", drop=False)
+
+
+def list_patient_names():
+    """
+    Returns the names of every virtual patient in simglucose's vpatient_params.csv
+    (adolescent#001-010, adult#001-010, child#001-010)
+    """
+    return patient_params_table().index.tolist()
 
 
 def get_model_path(base_dir: Path, model_name: str) -> Path:
     return base_dir / f"{model_name}.zip"
 
 
-def list_model_sets(root_dir: Path = Path("TrainingModels")):
+def list_model_sets(root_dir: Path = Path("TrainingModels"), patient_name=None):
     """
-    Returns all directories inside root_dir that contain valid .zip model files
+    Returns the complete model sets registered under root_dir, most recent first (see CoreLogic.model_registry)
     """
-    valid_sets = []
-    if not root_dir.exists():
-        return valid_sets
+    from CoreLogic.model_registry import ModelRegistry
 
-    for subdir in root_dir.iterdir():
-        if subdir.is_dir():
-            zip_files = list(subdir.glob("*.zip"))
-            if any(m.stem in {"lowmodel", "innermodel", "highmodel"} for m in zip_files):
-                valid_sets.append(subdir)
+    registry = ModelRegistry(root_dir)
+    return [registry.path(name) for name in registry.names(patient=patient_name)]
 
-    return sorted(valid_sets, key=lambda p: p.stat().st_mtime, reverse=True)  # Most recent first
 
+def prompt_user_to_choose_model_set(patient_name=None):
+    """
+    Asks which model set to use. With patient_name, option [0] is the latest set trained for that patient.
+    """
+    from CoreLogic.model_registry import ModelRegistry
 
-def prompt_user_to_choose_model_set():
-    model_sets = list_model_sets()
+    registry = ModelRegistry(Path("TrainingModels"))
+    model_sets = [registry.path(name) for name in registry.names()]
     if not model_sets:
         print("No trained model sets found in 'TrainingModels/'.")
         return None
 
-    most_recent = model_sets[0] if model_sets else None
+    most_recent = (registry.latest(patient_name) if patient_name else None) or model_sets[0]
 
     print("\nAvailable Trained Model Sets:")
     if most_recent:
@@ -99,7 +100,8 @@ def prompt_user_to_choose_model_set():
         elif choice == 1:
             print("\nModel Sets:")
             for i, path in enumerate(model_sets):
-                print(f" [{i}] {path.name}")
+                manifest = registry.get(path.name)
+                print(f" [{i}] {path.name}  ({manifest['algorithm'] or '?'}, {manifest['patient'] or '?'})")
             sub_choice = int(input("Choose model set: "))
             if 0 <= sub_choice < len(model_sets):
                 return model_sets[sub_choice]
@@ -116,7 +118,9 @@ def prompt_user_to_choose_model_set():
     return None
 
 
-def load_model_from_file(model_path: Path, model_type: str, env):
+def load_model_from_file(model_path: Path, model_type: str, env, device="auto"):
+    from stable_baselines3 import A2C, TD3, PPO
+
     if model_type == "A2C":
         model_class = A2C
     elif model_type == "PPO":
@@ -126,7 +130,35 @@ def load_model_from_file(model_path: Path, model_type: str, env):
     else:
         raise ValueError(f"Unsupported model type for loading: {model_type}")
     print(f"[Model I/O] Loading model from {model_path}")
-    return model_class.load(str(model_path), env=env)
+    return model_class.load(str(model_path), env=env, device=device)
+
+
+def load_inference_model_set(base_dir: Path, model_type: str = None, dose_table=False):
+    """
+    Loads (lowmodel, innermodel, highmodel) for prediction only: no environment, CPU, and the
+    algorithm taken from the set's manifest.json when model_type is not given.
+    Exported NumPy policies are used when the set has them, its compiled dose table (an interpolation
+    of the policies) only with dose_table=True.
+    """
+    from CoreLogic.numpy_policy import has_numpy_policies, load_numpy_policies, MODEL_NAMES
+    from CoreLogic.dose_table import has_dose_table, load_dose_table
+
+    base_dir = Path(base_dir)
+    if dose_table and has_dose_table(base_dir):
+        return load_dose_table(base_dir).models
+    if has_numpy_policies(base_dir):
+        return load_numpy_policies(base_dir)
+    if model_type is None:
+        import json
+        from CoreLogic.model_registry import MANIFEST_NAME
+
+        manifest_path = base_dir / MANIFEST_NAME
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+        model_type = manifest.get("algorithm")
+        if model_type is None:
+            raise ValueError(f"No algorithm recorded for {base_dir}, register it or pass model_type")
+    return tuple(load_model_from_file(get_model_path(base_dir, name), model_type, env=None, device="cpu")
+                 for name in MODEL_NAMES)
 
 
 def save_model(model, base_dir: Path, model_name: str):
@@ -145,6 +177,8 @@ class SimulationConfig:
     def __init__(self, model_type="PPO", patient_name=PATIENT_NAME, TIMESTEPS=300):
         self.save_to_csv = True
         self.save_video = True
+        # "offscreen" draws frames on an Agg canvas (works headless), "desktop" grabs the whole screen
+        self.video_capture = "offscreen"
         self.render_sim = True
         self.patient_name = patient_name
         self.start_time = datetime(2025, 1, 1, 0, 0, 0)
@@ -152,11 +186,45 @@ class SimulationConfig:
         self.max_episode_steps = 480
         self.model_type = model_type
         self.model_name = model_type
+        # Path of a ScenarioBank .npy; when set, meal days are read from it by index instead of drawn
+        self.scenario_bank = None
+        # Bank day the training/evaluation scenario is read from; extra training sub-envs use the days after it
+        self.scenario_day = 0
+        # Train lowmodel/innermodel/highmodel in three worker processes instead of one after another
+        self.parallel_training = False
+        # torch threads per training worker, None splits the CPUs evenly between the three
+        self.torch_threads = None
+        # Sub-environments (one process each) every regime model collects experience from
+        self.n_envs = 1
+        # Seeds the extra sub-environments' meal days and patients, None draws them randomly
+        self.training_seed = None
+        # Environment steps between training checkpoints, None disables checkpointing
+        self.checkpoint_freq = None
+        # Continue unfinished models from the checkpoints in the model-set directory
+        self.resume = False
+        # Write throughput, rollout/update timing and per-episode stats to <model set>/telemetry
+        self.telemetry = False
+        # Patient dynamics of headless envs: "scipy" (simglucose) or "numpy" (CoreLogic.patient_batch)
+        self.patient_backend = "scipy"
+        # Evaluation only: skip through stable, dose-free, meal-free stretches with one long integration
+        # (ignored while rendering or saving video, which need every step)
+        self.fast_forward = False
+        self.fast_forward_max_steps = 10
+        self.fast_forward_tolerance = 1.0  # mg/dL per 3-minute step that still counts as stable
+        # Model-predictive lookahead (CoreLogic.lookahead): the policy's dose competes with these candidates
+        # (U/min) over a short simulated horizon, within a per-decision time budget; rules still apply after it
+        self.lookahead = False
+        self.lookahead_candidates = (0.0, 0.05, 0.1, 0.2, 0.3)
+        self.lookahead_horizon = 90  # minutes
+        # seconds per decision; a decision needs ~45 ms for the 240-minute safety rollout, a rollout the
+        # budget cuts short keeps the policy's dose
+        self.lookahead_budget = 0.1
+        # Replace the trained networks by their interpolated dose table (CoreLogic.dose_table) once
+        # training or loading is done: the runner and LIME then make no network calls
+        self.dose_table = False
 
     def get_patient_params(self):
-        patient_params_file = pkg_resources.resource_filename("simglucose", "params/vpatient_params.csv")
-        patient_params = pd.read_csv(patient_params_file)
-        bw = patient_params[patient_params["Name"] == self.patient_name]["BW"].iloc[0]
+        bw = patient_params_table().at[self.patient_name, "BW"]
         return {"bw": bw}
 
 # === Scenario Generation ===
@@ -164,10 +232,36 @@ class SimulationConfig:
 class MealGenerator:
     def __init__(self, config: SimulationConfig):
         self.config = config
-
-    def create_meal_scenario(self, bw):
-        meal_events = generated_day(bw)
-        meals = [(event[1] // 60, event[0]) for event in meal_events]
+        self._bank = None
+
+    @property
+    def bank(self):
+        if self._bank is None and self.config.scenario_bank is not None:
+            self._bank = ScenarioBank(self.config.scenario_bank)
+        return self._bank
+
+    def create_meal_scenario(self, bw, rng=None, day_index=None):
+        """
+        With a scenario bank configured and day_index given the day is read from the bank, otherwise drawn
+        """
+        if day_index is not None and self.bank is not None:
+            return self._to_scenario(self.bank.meal_events(day_index, bw))
+        return self._to_scenario(generated_day(bw, rng=rng))
+
+    def create_meal_scenarios(self, bw, n_days, seed=None, start_index=None):
+        """
+        Returns n_days (scenario, meals) pairs, read from the bank starting at start_index when one is
+        configured, otherwise drawn in one vectorized call from a seeded generator
+        """
+        if start_index is not None and self.bank is not None:
+            return [self._to_scenario(self.bank.meal_events(start_index + i, bw)) for i in range(n_days)]
+        days = generate_meal_days(bw, n_days, profile=CHILD_MEAL_PROFILE, seed=seed)
+        return [self._to_scenario(meal_events(days, i)) for i in range(n_days)]
+
+    def _to_scenario(self, events):
+        from simglucose.simulation.scenario import CustomScenario
+
+        meals = [(event[1] // 60, event[0]) for event in events]
         return CustomScenario(start_time=self.config.start_time, scenario=meals), meals
 
     def print_meals(self, meals):
@@ -179,14 +273,69 @@ class MealGenerator:
 
 # === Environment Management ===
 
+# Environment class behind each role, in CoreLogic.customEnviroments
+ENV_CLASSES = {
+    "sim": "CustomT1DSimGymnaisumEnv",
+    "low": "LowGlucoseEnv",
+    "inner": "InnerGlucoseEnv",
+    "high": "HighGlucoseEnv",
+}
+
+
+class EnvironmentPool:
+    """
+    Per-process cache of headless environments. Each (kind, slot) is constructed once, later requests
+    reset the same instance to the new patient, scenario and seed instead of rebuilding the simulator.
+    Envs are wrapped in TimeLimit only, without gymnasium.make's render and checker wrappers.
+    """
+    _envs = {}
+
+    @classmethod
+    def get(cls, kind, patient_name, scenario, seed=None, max_episode_steps=480, slot=0, backend="scipy"):
+        """
+        Returns the pooled env of this kind, reset to patient_name/scenario.
+        seed=None on a reused env keeps its current seeds, so the initial glucose repeats.
+        """
+        key = (kind, slot, max_episode_steps, backend)
+        env = cls._envs.get(key)
+        if env is None:
+            from gymnasium.wrappers import TimeLimit
+            import CoreLogic.customEnviroments as custom_envs
+
+            env_class = getattr(custom_envs, ENV_CLASSES[kind])
+            env = TimeLimit(env_class(patient_name=patient_name, custom_scenario=scenario, seed=seed,
+                                      backend=backend),
+                            max_episode_steps=max_episode_steps)
+            cls._envs[key] = env
+        else:
+            env.reset(seed=seed, options={"patient_name": patient_name, "scenario": scenario})
+        return env
+
+    @classmethod
+    def clear(cls):
+        for env in cls._envs.values():
+            env.close()
+        cls._envs.clear()
+
+
 class EnvironmentManager:
     def __init__(self, config: SimulationConfig, meal_scenario):
         self.config = config
+        self.meal_scenario = meal_scenario
         self.base_kwargs = {
             "patient_name": config.patient_name,
             "custom_scenario": meal_scenario
         }
-        self.path_to_results = self._create_results_directory()
+        self._path_to_results = None
+
+    @property
+    def path_to_results(self):
+        """
+        Results folder of this run, created the first time something needs it
+        """
+        if self._path_to_results is None:
+            self._path_to_results = self._create_results_directory()
+        return self._path_to_results
 
     def _create_results_directory(self):
         base_folder = Path(f"SimResults/{self.config.model_name}_{self.config.patient_name}")
@@ -199,6 +348,8 @@ class EnvironmentManager:
         return base_folder
 
     def register_environments(self):
+        from gymnasium.envs.registration import register
+
         envs = [
             ("simglucose/adolescent2-v0", "CustomT1DSimGymnaisumEnv"),
             ("simglucose/adolescent2-v0-low", "LowGlucoseEnv"),
@@ -210,7 +361,15 @@ class EnvironmentManager:
                      max_episode_steps=self.config.max_episode_steps, kwargs=self.base_kwargs)
 
     def create_environments(self):
-        render = "human" if self.config.render_sim else None
+        if not self.config.render_sim:
+            return tuple(EnvironmentPool.get(kind, self.config.patient_name, self.meal_scenario,
+                                             max_episode_steps=self.config.max_episode_steps,
+                                             backend=self.config.patient_backend)
+                         for kind in ("sim", "low", "inner", "high"))
+
+        import gymnasium
+
+        render = "human"
         env = gymnasium.make("simglucose/adolescent2-v0", render_mode=render)
         lowenv = gymnasium.make("simglucose/adolescent2-v0-low", render_mode=render)
         innerenv = gymnasium.make("simglucose/adolescent2-v0-inner", render_mode=render)
@@ -219,19 +378,148 @@ class EnvironmentManager:
 
 # === Callback ===
 
-class RewardLoggerCallback(BaseCallback):
-    def __init__(self, verbose=0):
-        super().__init__(verbose)
-        self.rewards = []
+def __getattr__(name):
+    # RewardLoggerCallback subclasses an SB3 class, it is defined in CoreLogic.callbacks and
+    # only imported (together with torch) when it is first used.
+    if name == "RewardLoggerCallback":
+        from CoreLogic.callbacks import RewardLoggerCallback
+        return RewardLoggerCallback
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# === Trainer ===
 
-    def _on_step(self) -> bool:
-        self.rewards.append(self.locals['rewards'][0])
-        return True
+# Environment kind each regime model is trained on (see ENV_CLASSES)
+MODEL_ENV_KINDS = {"lowmodel": "low", "innermodel": "inner", "highmodel": "high"}
 
-    def save_to_csv(self, filename):
-        pd.DataFrame({'timestep': range(1, len(self.rewards)+1), 'reward': self.rewards}).to_csv(filename, index=False)
 
-# === Trainer ===
+def build_model(model_type: str, env, verbose=1):
+    """
+    Creates an untrained SB3 model of model_type on env
+    """
+    from stable_baselines3 import A2C, TD3, PPO
+    from stable_baselines3.common.noise import NormalActionNoise
+
+    if model_type == "A2C":
+        return A2C("MlpPolicy", env, verbose=verbose)
+    elif model_type == "PPO":
+        return PPO("MlpPolicy", env, verbose=verbose)
+    elif model_type == "TD3":
+        action_noise = NormalActionNoise(
+            mean=np.zeros(env.action_space.shape[-1]),
+            sigma=0.1 * np.ones(env.action_space.shape[-1])
+        )
+        return TD3("MlpPolicy", env, action_noise=action_noise, verbose=verbose)
+    raise ValueError(f"Unsupported model type for training: {model_type}")
+
+
+def _make_training_env(kind, patient_name, scenario, seed, max_episode_steps, backend="scipy"):
+    from stable_baselines3.common.monitor import Monitor
+
+    return Monitor(EnvironmentPool.get(kind, patient_name, scenario, seed=seed, max_episode_steps=max_episode_steps,
+                                       backend=backend))
+
+
+def make_training_vec_env(model_name, config: SimulationConfig, scenario, n_envs):
+    """
+    SubprocVecEnv of n_envs copies of model_name's environment. The first sub-env runs scenario,
+    the others get their own meal day and seed so a rollout covers several days at once.
+    """
+    from stable_baselines3.common.vec_env import SubprocVecEnv
+
+    bw = config.get_patient_params()["bw"]
+    extra = MealGenerator(config).create_meal_scenarios(bw, n_envs - 1, seed=config.training_seed,
+                                                        start_index=config.scenario_day + 1)
+    scenarios = [scenario] + [extra_scenario for extra_scenario, _ in extra]
+    if config.training_seed is None:
+        seeds = [None] * n_envs
+    else:
+        seeds = [config.training_seed + i for i in range(n_envs)]
+
+    return SubprocVecEnv([
+        functools.partial(_make_training_env, MODEL_ENV_KINDS[model_name], config.patient_name,
+                          env_scenario, seed, config.max_episode_steps, config.patient_backend)
+        for env_scenario, seed in zip(scenarios, seeds)
+    ], start_method="spawn")
+
+
+def load_checkpoint(model_name, checkpoint_dir: Path, model_type: str, env, reward_logger=None):
+    """
+    Loads model_name's latest checkpoint (model, replay buffer, reward log), or returns None if it has none
+    """
+    from CoreLogic.callbacks import checkpoint_paths
+
+    paths = checkpoint_paths(checkpoint_dir, model_name)
+    if not paths["meta"].exists():
+        return None
+    model = load_model_from_file(paths["model"], model_type, env)
+    if paths["replay_buffer"].exists() and hasattr(model, "load_replay_buffer"):
+        model.load_replay_buffer(str(paths["replay_buffer"]))
+    if reward_logger is not None and paths["rewards"].exists():
+        reward_logger.load_from_csv(paths["rewards"])
+    print(f"[{model_name}] resuming from checkpoint at {model.num_timesteps} steps")
+    return model
+
+
+def train_regime_model(model_name, env, config: SimulationConfig, base_dir: Path, verbose=1, save=True):
+    """
+    Trains one regime model on env (or on n_envs sub-environments) for config.time_steps steps.
+    With config.checkpoint_freq it checkpoints into base_dir/checkpoints, with config.resume it
+    continues from a checkpoint found there. With save the .zip and reward CSV are written to base_dir.
+    """
+    from stable_baselines3.common.callbacks import CallbackList
+    from CoreLogic.callbacks import (RewardLoggerCallback, TrainingCheckpointCallback, TrainingTelemetryCallback,
+                                     checkpoint_paths)
+
+    train_env = env
+    if config.n_envs > 1:
+        train_env = make_training_vec_env(model_name, config, env.unwrapped.env.custom_scenario, config.n_envs)
+
+    reward_logger = RewardLoggerCallback()
+    callbacks = [reward_logger]
+    checkpoint_dir = Path(base_dir) / "checkpoints"
+    model = None
+    if config.resume:
+        model = load_checkpoint(model_name, checkpoint_dir, config.model_type, train_env, reward_logger)
+    resumed = model is not None
+    if model is None:
+        model = build_model(config.model_type, train_env, verbose=verbose)
+    if config.checkpoint_freq:
+        callbacks.append(TrainingCheckpointCallback(config.checkpoint_freq, checkpoint_dir, model_name,
+                                                    reward_logger, verbose=verbose))
+    if config.telemetry:
+        callbacks.append(TrainingTelemetryCallback(Path(base_dir) / "telemetry", model_name, resume=resumed))
+
+    remaining = config.time_steps - model.num_timesteps
+    if remaining > 0:
+        model.learn(total_timesteps=remaining, callback=CallbackList(callbacks),
+                    reset_num_timesteps=model.num_timesteps == 0)
+    if train_env is not env:
+        train_env.close()
+
+    if save:
+        save_model(model, base_dir, model_name)
+        reward_logger.save_to_csv(Path(base_dir) / f"{model_name}_rewards.csv")
+        # The finished model supersedes its checkpoint
+        for path in checkpoint_paths(checkpoint_dir, model_name).values():
+            path.unlink(missing_ok=True)
+    return model
+
+
+def _train_model_job(model_name, config: SimulationConfig, scenario, base_dir, torch_threads):
+    """
+    Trains one regime model in a worker process and saves it with its reward CSV into base_dir
+    """
+    # Must be set before torch is imported, simulation_core does not import it at module level
+    os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+    os.environ["MKL_NUM_THREADS"] = str(torch_threads)
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    env = EnvironmentPool.get(MODEL_ENV_KINDS[model_name], config.patient_name, scenario,
+                              max_episode_steps=config.max_episode_steps, backend=config.patient_backend)
+    train_regime_model(model_name, env, config, base_dir, verbose=0)
+    return model_name
+
 
 class ModelTrainer:
     def __init__(self, lowenv, innerenv, highenv, config: SimulationConfig, model_save_path: Path = None):
@@ -241,8 +529,13 @@ class ModelTrainer:
         self.model_save_path = model_save_path
 
     def train_or_load_models(self, use_existing_models=False):
+        if self.config.resume and not self.model_save_path:
+            raise ValueError("Resuming needs the interrupted run's model_save_path")
+        if self.config.resume and not Path(self.model_save_path).is_dir():
+            raise FileNotFoundError(f"No model set to resume at {self.model_save_path}")
+
         if use_existing_models:
-            base_dir = prompt_user_to_choose_model_set()
+            base_dir = prompt_user_to_choose_model_set(self.config.patient_name)
             if base_dir is None:
                 print("No model set selected. Training from scratch.")
                 use_existing_models = False
@@ -258,52 +551,192 @@ class ModelTrainer:
             base_dir.mkdir(parents=True, exist_ok=True)
 
         for model_name, env in self.envs.items():
-            callback = RewardLoggerCallback()
             model = None
 
-            if use_existing_models:
+            if use_existing_models or self.config.resume:
                 model_path = get_model_path(base_dir, model_name)
                 if model_path.exists():
                     model = load_model_from_file(model_path, self.config.model_type, env)
                     print(f"[{model_name}] loaded from {model_path}")
-                else:
+                elif use_existing_models:
                     print(f"[{model_name}] not found in {base_dir}. Will train from scratch.")
 
+            if model is None and self.config.parallel_training:
+                # Trained together below
+                continue
+
             if model is None:
                 print(f"Training new model: {model_name}")
-                if self.config.model_type == "A2C":
-                    model = A2C("MlpPolicy", env, verbose=1)
-                elif self.config.model_type == "PPO":
-                    model = PPO("MlpPolicy", env, verbose=1)
-                elif self.config.model_type == "TD3":
-                    action_noise = NormalActionNoise(
-                        mean=np.zeros(env.action_space.shape[-1]),
-                        sigma=0.1 * np.ones(env.action_space.shape[-1])
-                    )
-                    model = TD3("MlpPolicy", env, action_noise=action_noise, verbose=1)
-
-                model.learn(total_timesteps=self.config.time_steps, callback=callback)
-                if not use_existing_models:
-                    save_model(model, base_dir, model_name)
-                    callback.save_to_csv(base_dir / f"{model_name}_rewards.csv")
+                model = train_regime_model(model_name, env, self.config, base_dir, save=not use_existing_models)
 
             self.models[model_name] = model
 
+        missing = [name for name in self.envs if name not in self.models]
+        if missing:
+            # Models trained to complete an existing set are not saved into it, same as sequential training
+            if use_existing_models:
+                import tempfile
+                # The models are read back into memory before the directory goes away
+                with tempfile.TemporaryDirectory() as save_dir:
+                    self.models.update(self.train_in_parallel(missing, Path(save_dir)))
+            else:
+                self.models.update(self.train_in_parallel(missing, base_dir))
+
+        if not use_existing_models:
+            from CoreLogic.numpy_policy import export_model_set
+            from CoreLogic.model_registry import ModelRegistry
+            export_model_set(self.models, base_dir)
+            ModelRegistry(base_dir.parent).register(base_dir, self.config.model_type, self.config.patient_name,
+                                                    self.config.time_steps)
+            # Every model is final now, a finished set does not keep replay buffers or partial checkpoints
+            import shutil
+            shutil.rmtree(base_dir / "checkpoints", ignore_errors=True)
+
         clear_console()
-        return self.models["lowmodel"], self.models["innermodel"], self.models["highmodel"]
+        models = self.models["lowmodel"], self.models["innermodel"], self.models["highmodel"]
+        if self.config.dose_table:
+            return self.compile_dose_table(models, None if use_existing_models else base_dir)
+        return models
+
+    def compile_dose_table(self, models, save_dir: Path = None):
+        """
+        The dose table's (lowmodel, innermodel, highmodel), saved into save_dir and its manifest when
+        given. Falls back to models when the table cannot match them.
+        """
+        from CoreLogic.dose_table import compile_dose_table
+
+        try:
+            table = compile_dose_table(models)
+        except ValueError as e:
+            print(Fore.YELLOW + f"No dose table, using the trained models: {e}")
+            return models
+        if save_dir is not None:
+            from CoreLogic.model_registry import ModelRegistry
+            table.save(save_dir)
+            ModelRegistry(save_dir.parent).register(save_dir)
+        return table.models
+
+    def train_in_parallel(self, model_names, save_dir: Path):
+        """
+        Trains model_names in one spawned process each, with torch pinned to its share of the CPUs.
+        The workers write the .zip models and reward CSVs into save_dir, they are then loaded back here.
+        """
+        threads = self.config.torch_threads or max(1, (os.cpu_count() or 1) // len(model_names))
+        print(f"Training {', '.join(model_names)} in parallel ({threads} torch threads each)")
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(model_names), mp_context=context) as pool:
+            futures = [
+                pool.submit(_train_model_job, name, self.config,
+                            self.envs[name].unwrapped.env.custom_scenario, save_dir, threads)
+                for name in model_names
+            ]
+            for future in futures:
+                print(f"[{future.result()}] training finished")
+
+        return {name: load_model_from_file(get_model_path(save_dir, name), self.config.model_type, self.envs[name])
+                for name in model_names}
+
+# === Step Recording ===
+
+def minutes_to_clock(minutes):
+    """
+    Vectorized minute-of-day -> "HH:MM" strings
+    """
+    minutes = np.asarray(minutes, dtype=np.int64) % (24 * 60)
+    hours = np.char.zfill((minutes // 60).astype(str), 2)
+    mins = np.char.zfill((minutes % 60).astype(str), 2)
+    return np.char.add(np.char.add(hours, ":"), mins)
+
+
+def as_log_frame(log_data):
+    """
+    Accepts a StepRecorder frame or the older list-of-dicts log and returns a DataFrame without copying frames
+    """
+    if isinstance(log_data, pd.DataFrame):
+        return log_data
+    return pd.DataFrame(log_data)
+
+
+class StepRecorder:
+    """
+    Per-step simulation log backed by a preallocated structured array and an integer minute-of-day clock.
+    frame is built once, views the recorded rows without copying them and is shared by all consumers.
+    clear() and restore() move to new arrays instead of overwriting the old ones, so a frame handed out
+    before keeps its rows.
+    """
+    COLUMNS = ("action", "blood glucose", "reward", "meal", "risk")
+
+    def __init__(self, capacity):
+        self._data = np.zeros(capacity, dtype=[(name, np.float64) for name in self.COLUMNS])
+        self._minutes = np.zeros(capacity, dtype=np.int32)
+        self._size = 0
+        self._frame = None
+
+    def __len__(self):
+        return self._size
+
+    def record(self, minute, action, blood_glucose, reward, meal, risk):
+        if self._size == len(self._data):
+            self._data = np.resize(self._data, 2 * len(self._data))
+            self._minutes = np.resize(self._minutes, 2 * len(self._minutes))
+        self._data[self._size] = (action, blood_glucose, reward, meal, risk)
+        self._minutes[self._size] = minute
+        self._size += 1
+        self._frame = None
+
+    def snapshot(self):
+        return self._data[:self._size].copy(), self._minutes[:self._size].copy()
+
+    def clear(self):
+        self._data = np.zeros(len(self._data), dtype=self._data.dtype)
+        self._minutes = np.zeros(len(self._minutes), dtype=self._minutes.dtype)
+        self._size = 0
+        self._frame = None
+
+    def restore(self, snapshot):
+        data, minutes = snapshot
+        self._size = len(data)
+        capacity = max(len(self._data), self._size)
+        self._data = np.zeros(capacity, dtype=self._data.dtype)
+        self._minutes = np.zeros(capacity, dtype=self._minutes.dtype)
+        self._data[:self._size] = data
+        self._minutes[:self._size] = minutes
+        self._frame = None
+
+    @property
+    def minutes(self):
+        return self._minutes[:self._size]
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            # All fields are float64, so the rows can be viewed as one 2-D block
+            values = self._data[:self._size].view(np.float64).reshape(self._size, len(self.COLUMNS))
+            frame = pd.DataFrame(values, columns=list(self.COLUMNS), copy=False)
+            frame["time"] = minutes_to_clock(self.minutes)
+            self._frame = frame
+        return self._frame
 
 # === Simulation Runner ===
 
 class SimulationRunner:
-    def __init__(self, env, lowmodel, innermodel, highmodel, config: SimulationConfig):
+    def __init__(self, env, lowmodel, innermodel, highmodel, config: SimulationConfig, video_writer=None):
         self.env = env
         self.lowmodel = lowmodel
         self.innermodel = innermodel
         self.highmodel = highmodel
         self.config = config
+        self.video_writer = video_writer
         self.frames = []
-        self.log_data = []
+        self.recorder = StepRecorder(config.max_episode_steps)
         self.insulin_timestamps = []
+        self.fast_forward_window = 1
+        self.controller = None
+        if config.lookahead:
+            from CoreLogic.lookahead import LookaheadController
+            self.controller = LookaheadController(config.lookahead_candidates, config.lookahead_horizon,
+                                                  config.lookahead_budget)
 
     def select_action(self, obs):
         value = obs[0]
@@ -324,28 +757,12 @@ class SimulationRunner:
         #     action = 0
         # action = min(action, 3.5)
 
-        # New, ultra-conservative rules for a sensitive pediatric patient, further refined for subtlety.
-        
-        # 1. Extremely gentle risk-based scaling to avoid any sudden increases.
-        coefficient = 1 + (risk / 30)  # Reduced from /20 to /30 for an even gentler effect.
-
-        # 2. An even lower initial cap on the model's output for very fine-grained control.
-        action = min(action, 0.3) * coefficient # Increased from 0.2 to 0.3 to encourage more action.
-
-        # 3. The "soft landing" for hypoglycemia prevention remains a critical safety feature.
-        if observation < 120:
-            # This creates a linear factor from 0.0 (at 100 mg/dL) to 1.0 (at 120 mg/dL).
-            # Below 100, the dose becomes 0.
-            scaling_factor = max(0, (observation - 100) / 20)
-            action *= scaling_factor
-
-        # 4. A hard maximum dose cap of 0.5 units remains as a final safety backstop.
-        action = min(action, 0.5)
-
+        # New, ultra-conservative rules for a sensitive pediatric patient (CoreLogic.dosing_rules)
+        action = float(scale_dose(action, observation, risk))
 
         # Dosing limits
         self.insulin_timestamps = [t for t in self.insulin_timestamps if t > current_time - timedelta(hours=1)]
-        if len(self.insulin_timestamps) >= 3:
+        if len(self.insulin_timestamps) >= MAX_INJECTIONS_PER_HOUR:
             print(Fore.RED + f"[Dosing Prohibited] Too many injections in last 1 hr.")
             action = 0
         elif action > 0:
@@ -354,49 +771,323 @@ class SimulationRunner:
 
         return action
 
-    def run(self):
-        obs, info = self.env.reset()
-        risk = 0
-        current_time = self.config.start_time
-        end_time = current_time + timedelta(hours=24)
-        truncated = False
+    def fast_forward_steps(self, obs, previous_obs, action_value, steps_left, proposal=0):
+        """
+        Number of 3-minute steps to cover with one long integration, 1 means a normal step.
+        The window doubles (up to fast_forward_max_steps) while neither the policy (proposal, before the
+        rules) nor the rules give a dose, glucose moves less than fast_forward_tolerance per step and no
+        meal is due, and drops back to 1 as soon as one of them fails. A window ends before the oldest
+        recent injection leaves the hourly limit, where the rules could change their answer.
+        """
+        config = self.config
+        if not config.fast_forward or config.render_sim or config.save_video:
+            return 1
+        stable = previous_obs is not None and abs(obs - previous_obs) <= config.fast_forward_tolerance
+        window = min(max(2, 2 * self.fast_forward_window), config.fast_forward_max_steps, steps_left)
+        recent = [t for t in self.insulin_timestamps if t > self.current_time - timedelta(hours=1)]
+        if recent:
+            window = min(window, (min(recent) + timedelta(hours=1) - self.current_time) // timedelta(minutes=3))
+        if action_value != 0 or proposal != 0 or not stable or window < 2 \
+                or self.env.unwrapped.meal_due(3 * window):
+            self.fast_forward_window = 1
+            return 1
+        self.fast_forward_window = window
+        return window
+
+    def start(self):
+        """
+        Resets the env and the loop state, run() calls it; call it directly to drive the day with advance()
+        """
+        self.obs, self.info = self.env.reset()
+        self.risk = 0
+        self.current_time = self.config.start_time
+        self.end_time = self.current_time + timedelta(hours=24)
+        self.minute = self.current_time.hour * 60 + self.current_time.minute
+        self.truncated = False
+        self.terminated = False
+        self.previous_obs = None
+        self.fast_forward_window = 1
+        self.insulin_timestamps = []
+        self.recorder.clear()
+
+    @property
+    def finished(self):
+        # terminated: glucose left simglucose's 10-600 mg/dL range, the episode is over
+        return self.current_time >= self.end_time or self.truncated or self.terminated
+
+    def advance(self, dose=None):
+        """
+        Simulates the next 3-minute decision (or a fast-forward window). dose overrides the policy and
+        the insulin rules for this step, for what-if branches.
+        """
+        self.current_time += timedelta(minutes=3)
+        self.minute += 3
+        obs, risk = self.obs, self.risk
+        meal_amount = self.info.get("meal", 0)  # Get meal amount for the current step
+
+        if dose is None:
+            action = self.select_action(obs)
+            # Extract scalar for rules and logging
+            action_value = proposal = action.item() if isinstance(action, np.ndarray) else action
+            if self.controller is not None:
+                # The rollout applies the same rules, from the same injection history, to every candidate
+                injections = [(t - self.current_time) / timedelta(minutes=1) for t in self.insulin_timestamps]
+                action_value = self.controller.choose_for_env(self.env.unwrapped, action_value, obs[0], risk,
+                                                              injections)
+            action_value = self.apply_insulin_rules(action_value, obs[0], risk, self.current_time)
+        else:
+            action_value = proposal = dose
+
+        steps_left = (self.end_time - self.current_time) // timedelta(minutes=3) + 1
+        time_limit = self._time_limit()
+        if time_limit is not None:
+            steps_left = min(steps_left, time_limit._max_episode_steps - time_limit._elapsed_steps)
+        n_steps = self.fast_forward_steps(obs[0], self.previous_obs, action_value, steps_left, proposal)
+        self.previous_obs = obs[0]
+        if n_steps > 1:
+            observations, rewards, risks, self.terminated = self.env.unwrapped.fast_forward(n_steps, action_value)
+            # A terminated window is cut at the step glucose left the range
+            n_steps = len(observations)
+            for k in range(n_steps):
+                self.recorder.record(self.minute + 3 * k, action_value, observations[k], rewards[k],
+                                     meal_amount if k == 0 else 0, risks[k])
+            if abs(observations[-1] - obs[0]) > self.config.fast_forward_tolerance * n_steps:
+                # Glucose started to move during the window, back to full resolution
+                self.fast_forward_window = 1
+            self.minute += 3 * (n_steps - 1)
+            self.current_time += timedelta(minutes=3 * (n_steps - 1))
+            self.previous_obs = observations[-2] if n_steps > 1 else obs[0]
+            self.obs = observations[-1:]
+            self.risk = risks[-1]
+            self.info = {"meal": 0, "risk": self.risk}
+            if time_limit is not None:
+                # The skipped steps count towards the episode limit like regular steps
+                time_limit._elapsed_steps += n_steps
+                self.truncated = time_limit._elapsed_steps >= time_limit._max_episode_steps
+            return
 
-        while current_time < end_time and not truncated:
+        # Environment expects an array for Box action space
+        action_for_env = np.array([action_value])
+
+        self.obs, reward, self.terminated, self.truncated, self.info = self.env.step(action_for_env)
+        self.risk = self.info.get("risk", 0)
+
+        self.recorder.record(self.minute, action_value, self.obs[0], reward, meal_amount, self.risk)
+
+    def run(self):
+        self.start()
+        while not self.finished:
             if self.config.render_sim:
                 self.env.render()
             if self.config.save_video:
-                screen = ImageGrab.grab()
-                self.frames.append(np.array(screen))
+                self.capture_frame()
+            self.advance()
+
+        if self.video_writer is not None:
+            self.video_writer.close()
+
+        return self.frames, self.recorder.frame
+
+    def _time_limit(self):
+        """
+        The TimeLimit wrapper around the env (its step counter is part of the run state), if any
+        """
+        from gymnasium import Wrapper
+        from gymnasium.wrappers import TimeLimit
+
+        env = self.env
+        while isinstance(env, Wrapper):
+            if isinstance(env, TimeLimit):
+                return env
+            env = env.env
+        return None
 
-            current_time += timedelta(minutes=3)
-            action = self.select_action(obs)
-            meal_amount = info.get("meal", 0)  # Get meal amount for the current step
+    def snapshot(self):
+        """
+        State of the run at this point: the env's simulation state, the loop state, the recorded log
+        and the dosing-rule state (insulin_timestamps). restore() continues from it.
+        """
+        return {
+            "env": self.env.unwrapped.snapshot(),
+            "elapsed_steps": self._time_limit()._elapsed_steps if self._time_limit() else None,
+            "loop": (self.obs, dict(self.info), self.risk, self.current_time, self.minute, self.truncated,
+                     self.terminated, self.previous_obs, self.fast_forward_window),
+            "insulin_timestamps": list(self.insulin_timestamps),
+            "recorder": self.recorder.snapshot(),
+        }
 
-            # Extract scalar for rules and logging
-            action_value = action.item() if isinstance(action, np.ndarray) else action
-            action_value = self.apply_insulin_rules(action_value, obs[0], risk, current_time)
+    def restore(self, snapshot):
+        self.env.unwrapped.restore(snapshot["env"])
+        if snapshot["elapsed_steps"] is not None:
+            self._time_limit()._elapsed_steps = snapshot["elapsed_steps"]
+        (self.obs, info, self.risk, self.current_time, self.minute, self.truncated,
+         self.terminated, self.previous_obs, self.fast_forward_window) = snapshot["loop"]
+        self.info = dict(info)
+        self.insulin_timestamps = list(snapshot["insulin_timestamps"])
+        self.recorder.restore(snapshot["recorder"])
+
+    def capture_frame(self):
+        if self.config.video_capture == "offscreen":
+            frame = self.env.unwrapped.render_frame()
+        else:
+            from PIL import ImageGrab
+            frame = np.array(ImageGrab.grab())
 
-            # Environment expects an array for Box action space
-            action_for_env = np.array([action_value])
+        # Stream to the encoder when one is attached, otherwise keep the frame for DataSaver.save_video
+        if self.video_writer is not None:
+            self.video_writer.write(frame)
+        else:
+            self.frames.append(frame)
+
+# === Batch Simulation Runner ===
+
+def create_batch_environments(pairs, max_episode_steps=480, seeds=None, backend="scipy"):
+    """
+    Returns one environment per (patient_name, meal_scenario) pair for BatchSimulationRunner.
+    The envs come from EnvironmentPool, so a worker running many batches reuses the same simulators.
+    seeds fixes each env's initial glucose and sensor noise.
+    """
+    seeds = seeds if seeds is not None else [None] * len(pairs)
+    return [
+        EnvironmentPool.get("sim", patient_name, scenario, seed=seed,
+                            max_episode_steps=max_episode_steps, slot=i, backend=backend)
+        for i, ((patient_name, scenario), seed) in enumerate(zip(pairs, seeds))
+    ]
 
-            obs, reward, terminated, truncated, info = self.env.step(action_for_env)
-            risk = info.get("risk", 0)
 
-            self.log_data.append({
-                "action": action_value,
-                "blood glucose": obs[0],
-                "reward": reward,
-                "meal": meal_amount,
-                "risk": risk,
-                "time": current_time.strftime("%H:%M")
-            })
+class BatchSimulationRunner:
+    """
+    Advances N patient/scenario environments in lockstep. Each tick the observations are grouped
+    by glucose regime so the low/inner/high models are called at most once, and the dosing rules
+    of SimulationRunner are applied to whole arrays.
+    """
+    def __init__(self, envs, lowmodel, innermodel, highmodel, config: SimulationConfig):
+        self.envs = list(envs)
+        self.lowmodel = lowmodel
+        self.innermodel = innermodel
+        self.highmodel = highmodel
+        self.config = config
+        self.injections = InjectionLimit(len(self.envs))
+        self.log_data = {}
+        self.minutes = np.zeros(0, dtype=np.int32)
+
+    def select_actions(self, obs):
+        """
+        obs is a numpy array of shape (n_envs, n_features), the result has shape (n_envs,)
+        """
+        values = obs[:, 0]
+        models = {"low": self.lowmodel, "inner": self.innermodel, "high": self.highmodel}
+        actions = np.zeros(len(values), dtype=np.float64)
+        for regime, mask in Predictor.regime_masks(values).items():
+            model = models[regime]
+            if mask.any():
+                action, _ = model.predict(obs[mask], deterministic=True)
+                actions[mask] = np.asarray(action).reshape(mask.sum(), -1)[:, 0]
+        return actions
+
+    def apply_insulin_rules(self, actions, observations, risks, current_minute, active=None):
+        """
+        Array version of SimulationRunner.apply_insulin_rules, current_minute is minutes since start.
+        """
+        # Dosing limits
+        return self.injections.apply(scale_dose(actions, observations, risks), current_minute, active)
 
-        return self.frames, self.log_data
+    def run(self):
+        n_envs = len(self.envs)
+        n_steps = int(timedelta(hours=24) / timedelta(minutes=3))
+        columns = ("action", "blood glucose", "reward", "meal", "risk")
+        self.log_data = {name: np.full((n_envs, n_steps), np.nan) for name in columns}
+        self.injections = InjectionLimit(n_envs)
+
+        resets = [env.reset() for env in self.envs]
+        obs = np.array([o for o, _ in resets], dtype=np.float32).reshape(n_envs, -1)
+        meals = np.array([info.get("meal", 0) for _, info in resets], dtype=np.float64)
+        risks = np.zeros(n_envs)
+        active = np.ones(n_envs, dtype=bool)
+
+        start_minute = self.config.start_time.hour * 60 + self.config.start_time.minute
+        self.minutes = start_minute + 3 * np.arange(1, n_steps + 1, dtype=np.int32)
+        for step in range(n_steps):
+            if not active.any():
+                break
+
+            actions = self.select_actions(obs)
+            actions = self.apply_insulin_rules(actions, obs[:, 0], risks, (step + 1) * 3, active)
+
+            self.log_data["action"][active, step] = actions[active]
+            self.log_data["meal"][active, step] = meals[active]
+            for i in np.flatnonzero(active):
+                o, reward, terminated, truncated, info = self.envs[i].step(np.array([actions[i]]))
+                obs[i] = o
+                risks[i] = info.get("risk", 0)
+                meals[i] = info.get("meal", 0)
+                self.log_data["blood glucose"][i, step] = o[0]
+                self.log_data["reward"][i, step] = reward
+                self.log_data["risk"][i, step] = risks[i]
+                # terminated: glucose left simglucose's 10-600 mg/dL range, the env must not be stepped again
+                if terminated or truncated:
+                    active[i] = False
+
+        return self.log_data
+
+    def run_log(self, index):
+        """
+        Returns the log of a single env as a DataFrame with the columns of SimulationRunner.run
+        """
+        recorded = ~np.isnan(self.log_data["blood glucose"][index])
+        frame = pd.DataFrame({name: self.log_data[name][index, recorded] for name in StepRecorder.COLUMNS})
+        frame["time"] = minutes_to_clock(self.minutes[recorded])
+        return frame
 
 # === Data Saving ===
 
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
+class StreamingVideoWriter:
+    """
+    Encodes frames on a background thread. write() blocks once max_queue frames are waiting,
+    so memory stays constant no matter how long the simulation runs.
+    """
+    _STOP = object()
+
+    def __init__(self, path: Path, fps=20, max_queue=32):
+        self.path = path
+        self.fps = fps
+        self.frame_count = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._thread = threading.Thread(target=self._encode, name="video-encoder", daemon=True)
+        self._thread.start()
+
+    def _encode(self):
+        try:
+            import imageio
+
+            with imageio.get_writer(self.path, format='FFMPEG', fps=self.fps) as writer:
+                while True:
+                    frame = self._queue.get()
+                    if frame is self._STOP:
+                        break
+                    writer.append_data(frame)
+        except Exception as e:
+            self._error = e
+            # Keep draining so the producer never blocks on a dead encoder
+            while self._queue.get() is not self._STOP:
+                pass
+
+    def write(self, frame):
+        if self._error is not None:
+            raise RuntimeError(f"Video encoding failed: {self._error}") from self._error
+        self._queue.put(frame)
+        self.frame_count += 1
+
+    def close(self):
+        if not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError(f"Video encoding failed: {self._error}") from self._error
+        print(Fore.GREEN + f"Saved video: {self.path} ({self.frame_count} frames)")
+
 
 class DataSaver:
     def __init__(self, path: Path, config: SimulationConfig):
@@ -405,7 +1096,7 @@ class DataSaver:
 
     def save_csv(self, data, filename="LogData.csv"):
         if self.config.save_to_csv:
-            df = pd.DataFrame(data)
+            df = as_log_frame(data)
             df.to_csv(self.path / filename, index=False)
             print(Fore.GREEN + f"Saved CSV: {self.path / filename}")
 
@@ -415,95 +1106,261 @@ class DataSaver:
             df.to_csv(self.path / filename, index=False)
             print(Fore.GREEN + f"Saved meals CSV: {self.path / filename}")
 
+    def open_video_stream(self, filename="Simulation.mp4"):
+        """
+        Returns a StreamingVideoWriter for SimulationRunner, or None when video saving is disabled
+        """
+        if not self.config.save_video:
+            return None
+        return StreamingVideoWriter(self.path / filename, fps=20)
+
     def save_video(self, frames, filename="Simulation.mp4"):
-        if self.config.save_video:
+        if self.config.save_video and frames:
+            import imageio
+
             print(Fore.YELLOW + "Saving video... this may take a moment.")
             imageio.mimsave(self.path / filename, frames, format='FFMPEG', fps=20)
             print(Fore.GREEN + f"Saved video: {self.path / filename}")
 
     def save_plot(self, data, filename="BG_Plot.png"):
-        if not self.config.save_to_csv or not data:
+        if not self.config.save_to_csv or data is None or len(data) == 0:
             return
 
         print(Fore.YELLOW + "Generating plot...")
-        df = pd.DataFrame(data)
+        df = as_log_frame(data)
         if df.empty:
             print(Fore.YELLOW + "Log data is empty, skipping plot generation.")
             return
 
-        fig, ax1 = plt.subplots(figsize=(15, 8))
+        plot_path = self.path / filename
+        PlotTemplate(len(df)).render(df, plot_path)
+        print(Fore.GREEN + f"Saved plot: {plot_path}")
+
+    def save_plots(self, jobs, max_workers=None, filename="BG_Plot.png"):
+        """
+        Renders many runs' plots on a process pool. jobs is a list of (directory, log data) pairs;
+        every worker keeps one PlotTemplate per run length and only updates its data.
+        """
+        if not self.config.save_to_csv or not jobs:
+            return []
+
+        payloads = []
+        for directory, data in jobs:
+            df = as_log_frame(data)
+            if not df.empty:
+                columns = {name: df[name].to_numpy() for name in PlotTemplate.COLUMNS}
+                payloads.append((str(Path(directory) / filename), columns))
+
+        print(Fore.YELLOW + f"Generating {len(payloads)} plots...")
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context) as pool:
+            paths = list(pool.map(_render_plot_job, *zip(*payloads), chunksize=8)) if payloads else []
+        print(Fore.GREEN + f"Saved {len(paths)} plots")
+        return paths
+
+
+class PlotTemplate:
+    """
+    The blood glucose / insulin / meal figure built once on an Agg canvas.
+    render() only swaps the artists' data, so one template can draw any number of runs of n_steps.
+    """
+    COLUMNS = ("time", "blood glucose", "action", "meal")
+
+    def __init__(self, n_steps):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.ticker import MaxNLocator, FuncFormatter
+
+        self.n_steps = n_steps
+        self.x = np.arange(n_steps)
+        # Placeholder labels of the final width so tight_layout leaves room for them
+        self.labels = np.full(n_steps, "00:00", dtype=object)
+
+        self.fig = Figure(figsize=(15, 8))
+        FigureCanvasAgg(self.fig)
+        ax1 = self.fig.add_subplot()
 
         # Blood Glucose
         color = 'tab:blue'
         ax1.set_xlabel('Time')
         ax1.set_ylabel('Blood Glucose (mg/dL)', color=color)
-        ax1.plot(df['time'], df['blood glucose'], color=color, label='Blood Glucose')
+        self.bg_line, = ax1.plot(self.x, np.zeros(n_steps), color=color, label='Blood Glucose')
         ax1.tick_params(axis='y', labelcolor=color)
         ax1.axhline(y=70, color='r', linestyle='--', label='Hypoglycemia (70)')
         ax1.axhline(y=180, color='orange', linestyle='--', label='Hyperglycemia (180)')
 
-        # X-axis ticks
-        plt.xticks(rotation=45)
-        ax1.xaxis.set_major_locator(MaxNLocator(24))
-        fig.autofmt_xdate()
+        # X-axis ticks show the run's HH:MM labels
+        ax1.xaxis.set_major_locator(MaxNLocator(24, integer=True))
+        ax1.xaxis.set_major_formatter(FuncFormatter(self._format_tick))
+        ax1.set_xlim(-0.5 - 0.05 * n_steps, n_steps - 0.5 + 0.05 * n_steps)
+        self.fig.autofmt_xdate(rotation=45)
 
         # Insulin
         ax2 = ax1.twinx()
         color = 'tab:green'
         ax2.set_ylabel('Insulin (U)', color=color)
-        insulin_times = df.loc[df['action'] > 0, 'time']
-        insulin_doses = df.loc[df['action'] > 0, 'action']
-        if not insulin_doses.empty:
-            ax2.bar(insulin_times, insulin_doses, color=color, alpha=0.6, width=0.8, label='Insulin Bolus')
+        self.insulin_bars = ax2.bar(self.x, np.zeros(n_steps), color=color, alpha=0.6, width=0.8,
+                                    label='Insulin Bolus')
         ax2.tick_params(axis='y', labelcolor=color)
-        ax2.set_ylim(0, max(3.5, insulin_doses.max() * 1.1 if not insulin_doses.empty else 3.5))
 
         # Meals
         ax3 = ax1.twinx()
         ax3.spines['right'].set_position(('outward', 60))
         color = 'tab:red'
         ax3.set_ylabel('Carbohydrates (g)', color=color)
-        meal_times = df.loc[df['meal'] > 0, 'time']
-        meal_carbs = df.loc[df['meal'] > 0, 'meal']
-        if not meal_carbs.empty:
-            ax3.bar(meal_times, meal_carbs, color=color, alpha=0.6, width=0.8, label='Meals')
+        self.meal_bars = ax3.bar(self.x, np.zeros(n_steps), color=color, alpha=0.6, width=0.8, label='Meals')
         ax3.tick_params(axis='y', labelcolor=color)
-        ax3.set_ylim(0, max(100, meal_carbs.max() * 1.1 if not meal_carbs.empty else 100))
 
         # Title and legend
-        plt.title('Simulation Results')
+        ax1.set_title('Simulation Results')
         lines, labels = ax1.get_legend_handles_labels()
         lines2, labels2 = ax2.get_legend_handles_labels()
         lines3, labels3 = ax3.get_legend_handles_labels()
         ax1.legend(lines + lines2 + lines3, labels + labels2 + labels3, loc='upper left')
-        
-        fig.tight_layout()
-        
-        plot_path = self.path / filename
-        plt.savefig(plot_path)
-        plt.close(fig)
-        print(Fore.GREEN + f"Saved plot: {plot_path}")
+
+        self.axes = (ax1, ax2, ax3)
+        self.fig.tight_layout()
+
+    def _format_tick(self, value, _pos):
+        index = int(round(value))
+        return self.labels[index] if 0 <= index < self.n_steps else ""
+
+    def render(self, data, path):
+        ax1, ax2, ax3 = self.axes
+        self.labels[:] = np.asarray(data["time"])
+        self.bg_line.set_ydata(np.asarray(data["blood glucose"], dtype=np.float64))
+        ax1.relim()
+        ax1.autoscale_view(scalex=False)
+
+        doses = np.clip(np.asarray(data["action"], dtype=np.float64), 0, None)
+        for bar, height in zip(self.insulin_bars, doses):
+            bar.set_height(height)
+            bar.set_visible(height > 0)
+        ax2.set_ylim(0, max(3.5, doses.max() * 1.1))
+
+        carbs = np.clip(np.asarray(data["meal"], dtype=np.float64), 0, None)
+        for bar, height in zip(self.meal_bars, carbs):
+            bar.set_height(height)
+            bar.set_visible(height > 0)
+        ax3.set_ylim(0, max(100, carbs.max() * 1.1))
+
+        self.fig.savefig(path)
+        return path
+
+
+# PlotTemplates of the current pool worker, keyed by run length
+_PLOT_TEMPLATES = {}
+
+
+def _render_plot_job(path, columns):
+    n_steps = len(columns["blood glucose"])
+    if n_steps not in _PLOT_TEMPLATES:
+        _PLOT_TEMPLATES[n_steps] = PlotTemplate(n_steps)
+    return _PLOT_TEMPLATES[n_steps].render(columns, path)
 
 # === Metrics ===
 
+def _runs(mask):
+    """
+    Row indices, starts and (exclusive) ends of the consecutive True runs in each row of a 2-D bool array
+    """
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends
+
+
+def count_glycemic_events(condition, min_steps, end_steps):
+    """
+    Counts episodes per row: the condition has to hold for at least min_steps samples and the
+    episode only ends after end_steps samples outside the condition (shorter gaps are merged).
+    """
+    n_runs, n_steps = condition.shape
+    rows, starts, ends = _runs(~condition)
+    short_gap = (starts > 0) & (ends < n_steps) & (ends - starts < end_steps)
+    fill = np.zeros((n_runs, n_steps + 1), dtype=np.int32)
+    np.add.at(fill, (rows[short_gap], starts[short_gap]), 1)
+    np.add.at(fill, (rows[short_gap], ends[short_gap]), -1)
+    merged = condition | (np.cumsum(fill, axis=1)[:, :n_steps] > 0)
+
+    rows, starts, ends = _runs(merged)
+    long_enough = ends - starts >= min_steps
+    return np.bincount(rows[long_enough], minlength=n_runs)
+
+
+def compute_glycemic_metrics(blood_glucose, reward=None, risk=None, sample_minutes=3, event_minutes=15):
+    """
+    Scores many runs at once. blood_glucose (and optional reward/risk) have shape (n_runs, n_steps);
+    NaN marks steps a run did not reach. Returns a dict of arrays with one value per run.
+
+    LBGI/HBGI follow Kovatchev (mean over all readings), GMI (%) = 3.31 + 0.02392 * mean BG,
+    CV is the sample standard deviation over the mean. Episodes need event_minutes below/above the
+    threshold and end after event_minutes back out of it.
+    """
+    bg = np.atleast_2d(np.asarray(blood_glucose, dtype=np.float64))
+    valid = ~np.isnan(bg)
+    n_valid = valid.sum(axis=1)
+    steps = int(np.ceil(event_minutes / sample_minutes))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_bg = np.nanmean(bg, axis=1)
+        lbgi, hbgi, _ = risk_index(bg)
+        risk_low = np.where(valid, lbgi, 0.0)
+        risk_high = np.where(valid, hbgi, 0.0)
+
+        metrics = {
+            "TIR (%)": ((bg >= 70) & (bg <= 180)).sum(axis=1) / n_valid * 100,
+            "Hypo Events": (bg < 70).sum(axis=1),
+            "Hyper Events": (bg > 180).sum(axis=1),
+        }
+        if risk is not None:
+            metrics["Mean Risk"] = np.nanmean(np.atleast_2d(risk), axis=1)
+        if reward is not None:
+            metrics["Average Reward"] = np.nanmean(np.atleast_2d(reward), axis=1)
+
+        metrics["Mean BG"] = mean_bg
+        metrics["LBGI"] = risk_low.sum(axis=1) / n_valid
+        metrics["HBGI"] = risk_high.sum(axis=1) / n_valid
+        metrics["GMI (%)"] = 3.31 + 0.02392 * mean_bg
+        metrics["CV (%)"] = np.nanstd(bg, axis=1, ddof=1) / mean_bg * 100
+        # Consensus bands, 70-180 is inclusive on both ends
+        bands = {
+            "Time <54 (%)": bg < 54,
+            "Time 54-70 (%)": (bg >= 54) & (bg < 70),
+            "Time 70-180 (%)": (bg >= 70) & (bg <= 180),
+            "Time 180-250 (%)": (bg > 180) & (bg <= 250),
+            "Time >250 (%)": bg > 250,
+        }
+        for label, band in bands.items():
+            metrics[label] = band.sum(axis=1) / n_valid * 100
+
+    metrics["Hypo Episodes"] = count_glycemic_events(bg < 70, steps, steps)
+    metrics["Level 2 Hypo Episodes"] = count_glycemic_events(bg < 54, steps, steps)
+    metrics["Hyper Episodes"] = count_glycemic_events(bg > 180, steps, steps)
+    metrics["Level 2 Hyper Episodes"] = count_glycemic_events(bg > 250, steps, steps)
+    return metrics
+
+
 class MetricsCalculator:
     def __init__(self, path: Path):
         self.path = path
 
     def calculate(self, log_data):
-        df = pd.DataFrame(log_data)
-        tir = ((df["blood glucose"] >= 70) & (df["blood glucose"] <= 180)).mean() * 100
-        hypo = (df["blood glucose"] < 70).sum()
-        hyper = (df["blood glucose"] > 180).sum()
-        mean_risk = df["risk"].mean()
-        avg_reward = df["reward"].mean()
-        return {
-            "TIR (%)": tir,
-            "Hypo Events": hypo,
-            "Hyper Events": hyper,
-            "Mean Risk": mean_risk,
-            "Average Reward": avg_reward
-        }
+        df = as_log_frame(log_data)
+        metrics = compute_glycemic_metrics(df["blood glucose"].to_numpy()[None, :],
+                                           reward=df["reward"].to_numpy()[None, :],
+                                           risk=df["risk"].to_numpy()[None, :])
+        return {k: v[0].item() for k, v in metrics.items()}
+
+    def calculate_many(self, log_arrays):
+        """
+        Scores a batch of runs, e.g. BatchSimulationRunner.log_data, returning one row per run
+        """
+        return pd.DataFrame(compute_glycemic_metrics(log_arrays["blood glucose"],
+                                                     reward=log_arrays.get("reward"),
+                                                     risk=log_arrays.get("risk")))
 
     def save(self, metrics, filename="metrics.txt"):
         with open(self.path / filename, "w") as f:
@@ -6,52 +6,63 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from flask import Flask, render_template, request, jsonify
 import numpy as np
 import os
-from pathlib import Path
-from CoreLogic.simulation_core import SimulationConfig, EnvironmentManager
+from concurrent.futures import ThreadPoolExecutor
+from CoreLogic.simulation_core import load_inference_model_set
 from CoreLogic.lime_explainer import Predictor
-from stable_baselines3 import A2C, PPO, TD3
+from CoreLogic.model_registry import ModelRegistry
+from CoreLogic.model_cache import ModelCache
 
 app = Flask(__name__)
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 MODELS_DIR = os.path.join(APP_ROOT, 'WorkingModels')
-MODEL_CACHE = {}
+# Index of WorkingModels, rescanned at start so sets copied in by hand are picked up
+REGISTRY = ModelRegistry(MODELS_DIR)
+REGISTRY.sync()
+# Loaded model sets, least recently used evicted past this many MB (per worker process)
+MODEL_CACHE = ModelCache(float(os.environ.get('DOSEWIZARD_CACHE_MB', 512)) * 2**20)
+# Model sets loaded in background threads at start: comma-separated names, or "all"
+PRELOAD_MODEL_SETS = os.environ.get('DOSEWIZARD_PRELOAD', '')
+# Serve a set's compiled dose table (an interpolation of its policies) instead of the policies: DOSEWIZARD_DOSE_TABLE=1
+USE_DOSE_TABLES = os.environ.get('DOSEWIZARD_DOSE_TABLE', '') == '1'
+# Largest number of readings one /predict_batch request may carry
+MAX_BATCH_SIZE = 100_000
+
+def _load_predictor(model_name):
+    """
+    Inference-only load: no environment, the algorithm comes from the set's manifest
+    """
+    manifest = REGISTRY.get(model_name)
+    if manifest is None:
+        raise FileNotFoundError(f"Model set not registered in {MODELS_DIR}: {model_name}")
+    models = load_inference_model_set(REGISTRY.path(model_name), manifest['algorithm'], dose_table=USE_DOSE_TABLES)
+    return Predictor(*models)
 
 def load_models(model_name):
-    if model_name in MODEL_CACHE:
-        return MODEL_CACHE[model_name]
-
-    model_path = Path(MODELS_DIR) / model_name
-    if not model_path.exists():
-        raise FileNotFoundError(f"Model directory not found: {model_path}")
-
-    config = SimulationConfig(model_type="PPO", patient_name="child#002") # patient_name is not used for prediction, but required by SimulationConfig
-    env_mgr = EnvironmentManager(config, None)  # Pass None for meal_scenario
-    env_mgr.register_environments()
-    env, lowenv, innerenv, highenv = env_mgr.create_environments()
-
-    models = {}
-    for model_short_name, env_instance in [("lowmodel", lowenv), ("innermodel", innerenv), ("highmodel", highenv)]:
-        # Construct the full path to the model file
-        full_model_path = model_path / f"{model_short_name}.zip"
-        if not full_model_path.exists():
-            raise FileNotFoundError(f"Model file not found: {full_model_path}")
-        
-        # Determine the model class based on the model type in the config
-        if config.model_type == "A2C":
-            model_class = A2C
-        elif config.model_type == "PPO":
-            model_class = PPO
-        elif config.model_type == "TD3":
-            model_class = TD3
-        else:
-            raise ValueError(f"Unsupported model type: {config.model_type}")
-
-        models[model_short_name] = model_class.load(str(full_model_path), env=env_instance)
-
-    predictor = Predictor(models["lowmodel"], models["innermodel"], models["highmodel"])
-    MODEL_CACHE[model_name] = predictor
-    return predictor
+    # Single-flight: a set already loading (e.g. warming up) is waited for rather than loaded twice
+    return MODEL_CACHE.get(model_name, lambda: _load_predictor(model_name))
+
+def _preload(model_name):
+    try:
+        load_models(model_name)
+    except Exception as e:
+        print(f"Preloading {model_name} failed: {e}")
+
+def start_preloading(model_names):
+    """
+    Loads model_names in background threads, so the first request for them finds them ready
+    """
+    model_names = [name for name in model_names if name not in MODEL_CACHE]
+    if not model_names:
+        return
+    executor = ThreadPoolExecutor(max_workers=min(4, len(model_names)), thread_name_prefix='preload')
+    for name in model_names:
+        executor.submit(_preload, name)
+    executor.shutdown(wait=False)
+
+if PRELOAD_MODEL_SETS:
+    start_preloading(REGISTRY.names() if PRELOAD_MODEL_SETS == 'all'
+                     else [name.strip() for name in PRELOAD_MODEL_SETS.split(',') if name.strip()])
 
 @app.route('/')
 def index():
@@ -59,10 +70,12 @@ def index():
 
 @app.route('/models')
 def get_models():
-    if not os.path.exists(MODELS_DIR):
-        return jsonify([])
-    models = [name for name in os.listdir(MODELS_DIR) if os.path.isdir(os.path.join(MODELS_DIR, name))]
-    return jsonify(models)
+    patient = request.args.get('patient')
+    return jsonify(REGISTRY.names(patient=patient))
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(MODEL_CACHE.stats())
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -84,6 +97,53 @@ def predict():
         print(f"An error occurred during prediction: {e}")
         return jsonify({'error': f"An error occurred on the server: {e}"}), 500
 
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    {"blood_glucose": [...], "meal": [...] (optional), "model_names": [...] or "model_name": "..."}
+    -> {"regime": [...], "predictions": {model set: [...]}}, every array aligned with blood_glucose
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'The request body must be a JSON object.'}), 400
+    model_names = data.get('model_names') or ([data['model_name']] if data.get('model_name') else [])
+    if not isinstance(model_names, list) or not all(isinstance(name, str) for name in model_names):
+        return jsonify({'error': 'model_names must be a list of model set names.'}), 400
+    try:
+        blood_glucose = np.asarray(data.get('blood_glucose', []), dtype=np.float64)
+        meal = np.asarray(data.get('meal') or np.zeros(blood_glucose.shape), dtype=np.float64)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'blood_glucose and meal must be lists of numbers.'}), 400
+    if blood_glucose.ndim != 1 or meal.ndim != 1:
+        return jsonify({'error': 'blood_glucose and meal must be flat lists of numbers.'}), 400
+    # null readings become NaN in the arrays
+    if not (np.isfinite(blood_glucose).all() and np.isfinite(meal).all()):
+        return jsonify({'error': 'blood_glucose and meal must not contain null, NaN or infinite values.'}), 400
+
+    if not model_names:
+        return jsonify({'error': 'Please select a model.'}), 400
+    if len(meal) != len(blood_glucose):
+        return jsonify({'error': 'blood_glucose and meal must have the same length.'}), 400
+    if len(blood_glucose) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} readings per request.'}), 400
+
+    obs = np.stack([blood_glucose, meal], axis=1)
+    masks = Predictor.regime_masks(blood_glucose)
+    regime = np.select([masks['low'], masks['inner'], masks['high']], Predictor.REGIMES, default='low')
+    try:
+        predictions = {}
+        for model_name in model_names:
+            predictions[model_name] = load_models(model_name).predict(obs)[:, 0].tolist()
+        return jsonify({'regime': regime.tolist(), 'predictions': predictions})
+    except FileNotFoundError:
+        return jsonify({'error': f"Unknown model set: {model_name}"}), 404
+    except Exception as e:
+        # The details stay in the server log
+        print(f"An error occurred during batch prediction: {e}")
+        return jsonify({'error': 'An error occurred on the server.'}), 500
+
 if __name__ == '__main__':
     if not os.path.exists(MODELS_DIR):
         os.makedirs(MODELS_DIR)
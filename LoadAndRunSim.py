@@ -1,8 +1,4 @@
-import os
-import pandas as pd
 from pathlib import Path
-from stable_baselines3 import A2C, TD3, PPO
-
 from CoreLogic.simulation_core import (
     SimulationConfig, MealGenerator, EnvironmentManager,
     ModelTrainer, SimulationRunner, DataSaver, MetricsCalculator, 
@@ -33,27 +29,35 @@ def main():
             print("Invalid input. Please enter a number.")
 
     use_existing_models = input("Do you want to load existing trained models? (y/n): ").strip().lower() == "y"
+    resume_dir = None
+    if not use_existing_models:
+        answer = input("Model-set path of an interrupted training run to resume (empty to start fresh): ").strip()
+        resume_dir = Path(answer) if answer else None
 
     config = SimulationConfig(model_type=model_type)
+    config.resume = resume_dir is not None
     patient_params = config.get_patient_params()
     print(f"Patient {config.patient_name} | BW: {patient_params['bw']} kg")
 
     meal_gen = MealGenerator(config)
-    scenario, meals = meal_gen.create_meal_scenario(patient_params["bw"])
+    scenario, meals = meal_gen.create_meal_scenario(patient_params["bw"], day_index=config.scenario_day)
     meal_gen.print_meals(meals)
 
     env_mgr = EnvironmentManager(config, scenario)
     env_mgr.register_environments()
     env, lowenv, innerenv, highenv = env_mgr.create_environments()
 
-    trainer = ModelTrainer(lowenv, innerenv, highenv, config, model_save_path=env_mgr.path_to_results)
+    trainer = ModelTrainer(lowenv, innerenv, highenv, config, model_save_path=resume_dir or env_mgr.path_to_results)
     lowmodel, innermodel, highmodel = trainer.train_or_load_models(use_existing_models)
 
-    runner = SimulationRunner(env, lowmodel, innermodel, highmodel, config)
+    # Frames are encoded while the simulation runs
+    saver = DataSaver(env_mgr.path_to_results, config)
+    runner = SimulationRunner(env, lowmodel, innermodel, highmodel, config,
+                              video_writer=saver.open_video_stream())
     frames, log_data = runner.run()
 
-    # Create a DataFrame from the log data
-    log_df = pd.DataFrame(log_data)
+    # The runner's log is already a DataFrame shared by LIME, DataSaver and MetricsCalculator
+    log_df = log_data
 
     # LIME Explanation
     if not log_df.empty:
@@ -80,7 +84,6 @@ def main():
         print(f"LIME explanation saved to: {explanation_path}")
 
 
-    saver = DataSaver(env_mgr.path_to_results, config)
     saver.save_csv(log_data)
     saver.save_video(frames)
     saver.save_plot(log_data)
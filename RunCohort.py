@@ -0,0 +1,72 @@
+import argparse
+import csv
+import time
+from pathlib import Path
+from datetime import datetime
+
+from CoreLogic.simulation_core import prompt_user_to_choose_model_set, SimulationConfig, DataSaver
+from CoreLogic.cohort_runner import CohortRunner
+from CoreLogic.scenario_generation import ScenarioBank
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a model set over every simglucose virtual patient")
+    parser.add_argument("--models", type=Path, help="Model set directory (prompted when omitted)")
+    parser.add_argument("--model-type", default="PPO", choices=["A2C", "PPO", "TD3"])
+    parser.add_argument("--days", type=int, default=10, help="Meal days per patient")
+    parser.add_argument("--days-per-task", type=int, default=5, help="Days simulated in lockstep per worker task")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: all cores)")
+    parser.add_argument("--patients", nargs="*", default=None, help="Subset of patient names")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenario-bank", type=Path, default=None,
+                        help="Read meal days from this bank (created with --days days if missing)")
+    parser.add_argument("--plots", action="store_true", help="Render a BG_Plot.png per run after the sweep")
+    args = parser.parse_args()
+
+    model_dir = args.models or prompt_user_to_choose_model_set()
+    if model_dir is None:
+        print("No model set selected.")
+        return
+
+    if args.scenario_bank is not None and not args.scenario_bank.exists():
+        ScenarioBank.create(args.scenario_bank, args.days, seed=args.seed)
+    elif args.scenario_bank is not None and len(ScenarioBank(args.scenario_bank)) < args.days:
+        parser.error(f"{args.scenario_bank} holds {len(ScenarioBank(args.scenario_bank))} days, fewer than --days {args.days}")
+
+    out_dir = Path(f"SimResults/Cohort_{args.model_type}_{datetime.now():%Y%m%d_%H%M%S}")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_file = out_dir / "cohort_results.csv"
+
+    runner = CohortRunner(model_dir, model_type=args.model_type, patient_names=args.patients,
+                          n_days=args.days, days_per_task=args.days_per_task,
+                          max_workers=args.workers, seed=args.seed, keep_logs=args.plots,
+                          scenario_bank=args.scenario_bank)
+    total = len(runner.patient_names) * args.days
+    print(f"Simulating {total} runs on {runner.max_workers} workers -> {out_file}")
+
+    start = time.perf_counter()
+    plot_jobs = []
+    with open(out_file, "w", newline="") as f:
+        writer = None
+        for done, result in enumerate(runner.run(), start=1):
+            row = {"patient": result["patient"], "day": result["day"], **result["metrics"]}
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+            f.flush()
+            if args.plots:
+                run_dir = out_dir / f"{result['patient']}_day{result['day']:03d}"
+                run_dir.mkdir(exist_ok=True)
+                plot_jobs.append((run_dir, result["log"]))
+            print(f"[{done}/{total}] {result['patient']} day {result['day']}: "
+                  f"TIR {result['metrics']['TIR (%)']:.1f}%")
+
+    if plot_jobs:
+        DataSaver(out_dir, SimulationConfig(model_type=args.model_type)).save_plots(plot_jobs, max_workers=args.workers)
+
+    print(f"Cohort finished in {time.perf_counter() - start:.1f}s. Results: {out_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,31 @@
+import argparse
+from pathlib import Path
 from CoreLogic.simulation_core import (
     SimulationConfig, MealGenerator, EnvironmentManager,
     ModelTrainer, SimulationRunner, DataSaver, MetricsCalculator
 )
-import pandas as pd
 from CoreLogic.lime_explainer import Predictor, Explainer
 
 
 # === Main Entry Point ===
 def main():
+    parser = argparse.ArgumentParser(description="Train the low/inner/high models, then simulate and explain them")
+    parser.add_argument("--resume", type=Path, default=None,
+                        help="Model-set directory of an interrupted run to continue from its checkpoints/")
+    parser.add_argument("--checkpoint-freq", type=int, default=None,
+                        help="Environment steps between training checkpoints (default: no checkpoints)")
+    args = parser.parse_args()
+
     # Setup Config 
     config = SimulationConfig(model_type="PPO", patient_name="child#002")
+    config.checkpoint_freq = args.checkpoint_freq
+    config.resume = args.resume is not None
     patient_params = config.get_patient_params()
     print(f"Patient {config.patient_name} | BW: {patient_params['bw']} kg")
 
     # Generate Meals
     meal_gen = MealGenerator(config)
-    scenario, meals = meal_gen.create_meal_scenario(patient_params["bw"])
+    scenario, meals = meal_gen.create_meal_scenario(patient_params["bw"], day_index=config.scenario_day)
     meal_gen.print_meals(meals)
 
     # Manage Enviroments
@@ -24,15 +34,17 @@ def main():
     env, lowenv, innerenv, highenv = env_mgr.create_environments()
 
     # Train Models
-    trainer = ModelTrainer(lowenv, innerenv, highenv, config, model_save_path=env_mgr.path_to_results)
+    trainer = ModelTrainer(lowenv, innerenv, highenv, config, model_save_path=args.resume or env_mgr.path_to_results)
     lowmodel, innermodel, highmodel = trainer.train_or_load_models(use_existing_models=False)
 
-    # Run the simulation
-    runner = SimulationRunner(env, lowmodel, innermodel, highmodel, config)
+    # Run the simulation, frames are encoded while it runs
+    saver = DataSaver(env_mgr.path_to_results, config)
+    runner = SimulationRunner(env, lowmodel, innermodel, highmodel, config,
+                              video_writer=saver.open_video_stream())
     frames, log_data = runner.run()
 
-    # Create a DataFrame from the log data
-    log_df = pd.DataFrame(log_data)
+    # The runner's log is already a DataFrame shared by LIME, DataSaver and MetricsCalculator
+    log_df = log_data
 
     # LIME Explanation
     if not log_df.empty:
@@ -74,7 +86,6 @@ def main():
             print("No actions were taken during the simulation, so no LIME explanations were generated.")
 
     # Save Result and metrics
-    saver = DataSaver(env_mgr.path_to_results, config)
     saver.save_csv(log_data)
     saver.save_meals_to_csv(meals)
     saver.save_video(frames)
@@ -0,0 +1,56 @@
+import sys
+import os
+import io
+import contextlib
+import numpy as np
+import pytest
+# Add the repository root to the Python path so the tests import CoreLogic like the entry points do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class GlucosePolicy:
+    """
+    Stand-in regime model: dose as a function of the glucose reading
+    """
+    def __init__(self, dose):
+        self.dose = dose
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        glucose = np.asarray(observation, dtype=np.float64).reshape(len(observation), -1)[:, 0]
+        return np.asarray(self.dose(glucose), dtype=np.float32).reshape(-1, 1), state
+
+
+POLICIES = {
+    "flat": GlucosePolicy(lambda g: np.full(len(g), 0.1)),
+    "proportional": GlucosePolicy(lambda g: np.clip((g - 90) / 300, 0, 0.3)),
+    # Doses only when high, so stable stretches below 160 mg/dL are fast-forwarded
+    "threshold": GlucosePolicy(lambda g: np.where(g > 160, 0.2, 0.0)),
+}
+
+
+@pytest.fixture
+def simulate_day():
+    """
+    simulate_day(patient_name, day, policy name, **config) -> metrics of one SimulationRunner day.
+    day seeds the meals, the initial state and the sensor noise.
+    """
+    from CoreLogic.simulation_core import (SimulationConfig, MealGenerator, EnvironmentPool, SimulationRunner,
+                                           compute_glycemic_metrics)
+
+    def simulate(patient_name, day, policy, **settings):
+        config = SimulationConfig(patient_name=patient_name)
+        config.render_sim = False
+        config.save_video = False
+        for name, value in settings.items():
+            setattr(config, name, value)
+        scenario, _ = MealGenerator(config).create_meal_scenario(config.get_patient_params()["bw"],
+                                                                 rng=np.random.default_rng(day))
+        env = EnvironmentPool.get("sim", patient_name, scenario, seed=day, max_episode_steps=config.max_episode_steps,
+                                  backend=config.patient_backend)
+        runner = SimulationRunner(env, POLICIES[policy], POLICIES[policy], POLICIES[policy], config)
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, log = runner.run()
+        metrics = compute_glycemic_metrics(log["blood glucose"].to_numpy()[None])
+        return {name: float(value[0]) for name, value in metrics.items()}
+
+    return simulate
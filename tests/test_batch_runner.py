@@ -0,0 +1,32 @@
+import numpy as np
+from conftest import POLICIES
+from CoreLogic.simulation_core import SimulationConfig, BatchSimulationRunner
+
+
+class ScriptedEnv:
+    """
+    Reports the given glucose readings and ends the episode (terminated) after the last one
+    """
+    def __init__(self, glucose):
+        self.glucose = list(glucose)
+        self.steps = 0
+
+    def reset(self):
+        self.steps = 0
+        return np.array([120.0, 0.0]), {}
+
+    def step(self, action):
+        assert self.steps < len(self.glucose), "stepped after the episode ended"
+        value = self.glucose[self.steps]
+        self.steps += 1
+        return np.array([value, 0.0]), 0.0, self.steps == len(self.glucose), False, {"risk": 0.0}
+
+
+def test_terminated_envs_are_not_stepped_again():
+    envs = [ScriptedEnv([120.0, 9.0]), ScriptedEnv([150.0] * 5)]
+    policy = POLICIES["flat"]
+    runner = BatchSimulationRunner(envs, policy, policy, policy, SimulationConfig(patient_name="child#002"))
+    runner.run()
+    assert envs[0].steps == 2 and envs[1].steps == 5
+    assert runner.run_log(0)["blood glucose"].tolist() == [120.0, 9.0]
+    assert len(runner.run_log(1)) == 5
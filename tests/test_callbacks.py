@@ -0,0 +1,61 @@
+import pandas as pd
+from types import SimpleNamespace
+from CoreLogic import callbacks
+from CoreLogic.callbacks import TrainingTelemetryCallback
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def start(output_dir, monkeypatch, resume=False, chunk_size=2):
+    clock = Clock()
+    monkeypatch.setattr(callbacks.time, "perf_counter", clock)
+    model = SimpleNamespace(num_timesteps=0, get_env=lambda: SimpleNamespace(num_envs=1))
+    callback = TrainingTelemetryCallback(output_dir, "PPO_inner", chunk_size=chunk_size, resume=resume)
+    callback.init_callback(model)
+    callback.on_training_start({}, {})
+    return callback, clock
+
+
+def rollout(callback, clock, collect, update, steps=100):
+    callback.on_rollout_start()
+    clock.now += collect
+    callback.num_timesteps += steps
+    callback.on_rollout_end()
+    clock.now += update
+
+
+def test_update_is_written_to_the_rollout_it_followed(tmp_path, monkeypatch):
+    callback, clock = start(tmp_path, monkeypatch)
+    for collect, update in [(1.0, 10.0), (2.0, 20.0), (3.0, 30.0)]:
+        rollout(callback, clock, collect, update)
+    callback.on_training_end()
+
+    rows = pd.read_csv(tmp_path / "PPO_inner_rollouts.csv")
+    assert rows["rollout_s"].tolist() == [1.0, 2.0, 3.0]
+    assert rows["update_s"].tolist() == [10.0, 20.0, 30.0]
+    assert rows["timesteps"].tolist() == [100, 200, 300]
+
+
+def test_stopping_during_a_rollout_keeps_the_measured_updates(tmp_path, monkeypatch):
+    callback, clock = start(tmp_path, monkeypatch)
+    rollout(callback, clock, 1.0, 10.0)
+    # Stopped during the second rollout: it never ends, and the first one's update is already known
+    callback.on_rollout_start()
+    clock.now += 5.0
+    callback.on_training_end()
+    rows = pd.read_csv(tmp_path / "PPO_inner_rollouts.csv")
+    assert rows["update_s"].tolist() == [10.0]
+
+
+def test_files_restart_unless_resuming(tmp_path, monkeypatch):
+    for resume, expected in [(False, 1), (False, 1), (True, 2)]:
+        callback, clock = start(tmp_path, monkeypatch, resume=resume)
+        rollout(callback, clock, 1.0, 1.0)
+        callback.on_training_end()
+        assert len(pd.read_csv(tmp_path / "PPO_inner_rollouts.csv")) == expected
@@ -0,0 +1,12 @@
+import pytest
+from conftest import POLICIES
+
+
+@pytest.mark.parametrize("policy", sorted(POLICIES))
+@pytest.mark.parametrize("day", [1, 3])
+def test_lookahead_never_adds_time_below_range(simulate_day, policy, day):
+    # A generous budget, so decisions do not depend on the machine's speed
+    baseline = simulate_day("child#002", day, policy, patient_backend="numpy")
+    lookahead = simulate_day("child#002", day, policy, patient_backend="numpy", lookahead=True, lookahead_budget=10.0)
+    below = ("Time <54 (%)", "Time 54-70 (%)")
+    assert sum(lookahead[name] for name in below) <= sum(baseline[name] for name in below)
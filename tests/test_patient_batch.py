@@ -0,0 +1,7 @@
+from CoreLogic.patient_batch import check_parity
+
+
+def test_numpy_backend_matches_simglucose():
+    # One patient per age group over a full day of parity_schedule; all 30 take about two minutes
+    error, _, _ = check_parity(["child#002", "adolescent#003", "adult#001"])
+    assert error <= 0.01
@@ -0,0 +1,35 @@
+import pytest
+
+
+@pytest.fixture
+def client():
+    from DoseWizard_FlaskApp.app import app
+    return app.test_client()
+
+
+@pytest.mark.parametrize("body", [
+    [1, 2, 3],
+    "120",
+    {"blood_glucose": [120], "model_names": "PPO_adult#002_00"},
+    {"blood_glucose": [120], "model_names": ["PPO_adult#002_00", 3]},
+    {"blood_glucose": [120], "model_name": 3},
+    {"blood_glucose": [120, None], "model_name": "PPO_adult#002_00"},
+    {"blood_glucose": [120, 130], "meal": [0, None], "model_name": "PPO_adult#002_00"},
+    {"blood_glucose": [[120]], "model_name": "PPO_adult#002_00"},
+])
+def test_malformed_requests_are_rejected(client, body):
+    response = client.post("/predict_batch", json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_nan_readings_are_rejected(client):
+    response = client.post("/predict_batch", data='{"blood_glucose": [NaN], "model_name": "PPO_adult#002_00"}',
+                           content_type="application/json")
+    assert response.status_code == 400
+
+
+def test_unknown_model_set(client):
+    response = client.post("/predict_batch", json={"blood_glucose": [120], "model_name": "no such set"})
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Unknown model set: no such set"}
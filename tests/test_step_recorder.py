@@ -0,0 +1,26 @@
+from CoreLogic.simulation_core import StepRecorder
+
+
+def record_day(recorder, glucose):
+    for k, value in enumerate(glucose):
+        recorder.record(3 * k, 0.0, value, 0.0, 0.0, 0.0)
+
+
+def test_frames_survive_restore_and_clear():
+    recorder = StepRecorder(4)
+    record_day(recorder, [100.0, 110.0])
+    snapshot = recorder.snapshot()
+    record_day(recorder, [200.0, 210.0, 220.0])
+    before_restore = recorder.frame
+
+    recorder.restore(snapshot)
+    record_day(recorder, [300.0])
+    assert before_restore["blood glucose"].tolist() == [100.0, 110.0, 200.0, 210.0, 220.0]
+    assert recorder.frame["blood glucose"].tolist() == [100.0, 110.0, 300.0]
+
+    before_clear = recorder.frame
+    recorder.clear()
+    record_day(recorder, [400.0])
+    assert before_clear["blood glucose"].tolist() == [100.0, 110.0, 300.0]
+    assert recorder.frame["blood glucose"].tolist() == [400.0]
+    assert recorder.frame["time"].tolist() == ["00:00"]